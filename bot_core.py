@@ -1,18 +1,49 @@
+import io
 import os
+import shutil
 import tempfile
 import asyncio
 import logging
-import mimetypes
+import bisect
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional, Protocol, Any, Dict
-from collections import defaultdict
+from typing import Optional, Protocol, Any, Dict, List, AsyncIterable, Union, Tuple, Set
+from collections import defaultdict, deque, OrderedDict
 import threading
 
+import numpy as np
+
 try:
     import whisper
 except ImportError:
     whisper = None
 
+try:
+    import faster_whisper
+except ImportError:
+    faster_whisper = None
+
+try:
+    import ctranslate2  # Installed with faster-whisper
+except ImportError:
+    ctranslate2 = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+try:
+    import pywhispercpp.model as whispercpp
+except ImportError:
+    whispercpp = None
+
 
 @dataclass
 class Config:
@@ -22,6 +53,7 @@ class Config:
     
     # Audio processing constants  
     AUDIO_SAMPLE_RATE = 16000
+    WHISPER_WINDOW_SECONDS = 30  # Whisper encodes audio in fixed 30 s windows
     TRANSCRIPTION_TIME_FACTOR = 35  # seconds per minute of audio
     MIN_AUDIO_DURATION = 1 # seconds
     
@@ -30,10 +62,28 @@ class Config:
     DEFAULT_MAX_QUEUE_SIZE = 100
     DEFAULT_NUM_WORKERS = 2
     DEFAULT_MAX_JOBS_PER_USER = 2
+    DEFAULT_MAX_BATCH_SIZE = 4
+    DEFAULT_TRANSCRIPT_CACHE_SIZE = 1000  # Transcriptions remembered for forwarded/re-sent files
+    PARALLEL_DOWNLOADS = 4  # Ranged download requests in flight per large file
+    DOWNLOAD_SEGMENT_CHUNKS = 8  # Requests per ranged download (4 MiB)
+    BATCH_WAIT_SECONDS = 0.05  # How long an idle worker waits for more jobs to batch
+    STATUS_DEBOUNCE_SECONDS = 0.5  # Status text must stay unchanged this long before it is sent
+    DELETE_BATCH_SECONDS = 0.1  # Processing messages deleted within this window go out as one request per chat
+    MAX_CONCURRENT_SENDS = 5  # Parallel sends per transcription, well under Telegram's per-chat limits
     DEFAULT_WHISPER_MODEL = "base"
+    DEFAULT_WHISPER_BACKEND = "faster-whisper"
+    DEFAULT_COMPUTE_TYPE = "int8"  # int8, int8_float16, float16, ... (used when the CPU can't be probed)
+    MAX_IN_MEMORY_DECODE_SIZE = 64 * 1024 * 1024  # Larger MP4-family files are decoded from a temp file
+    MAX_REUSED_DECODE_SECONDS = 600  # Longer decode buffers are freed instead of kept for reuse
+    MAX_REUSED_DECODE_BYTES = 64 * 1024 * 1024  # Total size of the decode buffers kept between jobs
+    BEAM_SIZE = 1  # Greedy decoding; beam search roughly doubles decode time for a small accuracy gain
+    CHUNK_BATCH_SIZE = 16  # Speech chunks of one long recording decoded together
+    VAD_MIN_SILENCE_MS = 500  # Pauses longer than this are cut out before transcription
+    VAD_FRAME_MS = 30  # webrtcvad accepts 10, 20 or 30 ms frames
+    VAD_AGGRESSIVENESS = 2  # webrtcvad scale from 0 (keep most audio) to 3 (keep least)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Job:
     chat_id: int
     message_id: int
@@ -42,6 +92,8 @@ class Job:
     mime_type: str
     file_size: int
     processing_msg_id: int
+    file_unique_id: Optional[str] = None
+    duration: Optional[float] = None  # Seconds, from Telegram's metadata when known
 
 
 class BotProtocol(Protocol):
@@ -56,121 +108,868 @@ class BotProtocol(Protocol):
     
     async def delete_messages(self, entity, message_ids) -> Any:
         ...
+    
+    def iter_download(self, file, offset: int = 0, limit: Optional[int] = None, request_size: int = ...) -> AsyncIterable[bytes]:
+        ...
+
+
+class WhisperBackend(Protocol):
+    name: str
+    package: str
+    supports_batching: bool  # Whether transcribe_batch shares a forward pass between clips
+    pin_threads: bool  # Whether compute threads inherit the transcription thread's CPU affinity
+
+    def is_available(self) -> bool:
+        ...
+
+    def devices(self) -> List[str]:
+        ...
+
+    def uses_compute_type(self) -> bool:
+        ...
+
+    def load_model(self, model_name: str, device: str) -> Any:
+        ...
+
+    def transcribe(self, model, audio) -> str:
+        ...
+
+    def transcribe_batch(self, model, audios: List[Any]) -> List[str]:
+        ...
+
+    def warm_up(self, model, batch_size: int = 1) -> None:
+        ...
+
+
+class OpenAIWhisperBackend:
+    """Reference PyTorch implementation from the openai-whisper package."""
+    name = "openai"
+    package = "openai-whisper"
+    supports_batching = False
+    pin_threads = True
+
+    def __init__(self, compute_type: str = Config.DEFAULT_COMPUTE_TYPE, compile_encoder: bool = False, num_workers: int = 1):
+        self.compute_type = compute_type
+        self.compile_encoder = compile_encoder
+        self.num_workers = max(num_workers, 1)
+
+    def is_available(self) -> bool:
+        return whisper is not None
+
+    def devices(self) -> List[str]:
+        """Every CUDA GPU when available, otherwise the CPU."""
+        if torch is not None and torch.cuda.is_available():
+            return [f"cuda:{index}" for index in range(torch.cuda.device_count())]
+        return ["cpu"]
+
+    def uses_compute_type(self) -> bool:
+        # Only CPU models are quantized; GPU models run as loaded
+        return self.devices() == ["cpu"]
+
+    def load_model(self, model_name: str, device: str = "cpu"):
+        model = whisper.load_model(model_name, device=device)
+        if torch is not None and model.device.type == "cpu":
+            # Each transcription thread is pinned to its own slice of the cores, and the
+            # intra-op threads it starts inherit that slice; more would just contend
+            torch.set_num_threads(max((os.cpu_count() or 1) // self.num_workers, 1))
+        # PyTorch dynamic quantization only runs on CPU; GPU models stay as loaded
+        if self.compute_type.startswith("int8") and torch is not None and model.device.type == "cpu":
+            model = self._quantize(model)
+        if torch is not None and model.device.type == "cuda":
+            # whisper calls the encoder directly, so its forward is what gets replaced
+            forward = model.encoder.forward
+            if self.compile_encoder:
+                # Fuses the encoder's kernels for its one fixed input shape. Compiling takes
+                # minutes and happens during the graph warmup of the first transcription.
+                forward = torch.compile(forward, dynamic=False)
+            model.encoder.forward = CudaGraphRunner(forward)
+        return model
+
+    @staticmethod
+    def _quantize(model):
+        """Quantize the model's Linear layers to int8 once at load time.
+
+        Conv1d layers are left alone: the audio stem is cheap, and PyTorch has no
+        dynamic int8 Conv1d on CPU.
+        """
+        for module in model.modules():
+            # openai-whisper subclasses nn.Linear only to cast weights under fp16.
+            # The quantizer matches exact types, and on CPU the base class is equivalent.
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def transcribe(self, model, audio) -> str:
+        audio = self._speech_only(audio)
+        if len(audio) == 0:
+            return ""
+        return self._run(model, audio)
+
+    def _run(self, model, audio) -> str:
+        on_gpu = model.device.type == "cuda"
+        if on_gpu and torch is not None:
+            # whisper computes the log-mel spectrogram wherever the samples are, so
+            # moving them first runs the STFT on the GPU rather than the CPU
+            audio = torch.from_numpy(np.asarray(audio, dtype=np.float32)).to(model.device)
+        # Weights stay FP32; whisper casts them per layer, so fp16 inference needs no .half().
+        # Only the text is used: skip word alignment, and don't feed each window's text
+        # back as the next prompt, which costs decoding time and can loop on repeats.
+        result = model.transcribe(
+            audio, fp16=on_gpu, word_timestamps=False, condition_on_previous_text=False
+        )
+        return result["text"]
+
+    @staticmethod
+    def _speech_only(audio):
+        """Keep only the frames webrtcvad marks as speech, when webrtcvad is installed.
+
+        openai-whisper has no VAD of its own and encodes every 30 s window,
+        silent or not.
+        """
+        if webrtcvad is None:
+            return audio
+        audio = np.asarray(audio, dtype=np.float32)
+        frame = Config.AUDIO_SAMPLE_RATE * Config.VAD_FRAME_MS // 1000
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        vad = webrtcvad.Vad(Config.VAD_AGGRESSIVENESS)
+        voiced = [
+            audio[start:start + frame]
+            for start in range(0, len(pcm) - frame + 1, frame)
+            if vad.is_speech(pcm[start:start + frame].tobytes(), Config.AUDIO_SAMPLE_RATE)
+        ]
+        return np.concatenate(voiced) if voiced else audio[:0]
+
+    def transcribe_batch(self, model, audios: List[Any]) -> List[str]:
+        # openai-whisper has no batched decoding API
+        return [self.transcribe(model, audio) for audio in audios]
+
+    def warm_up(self, model, batch_size: int = 1) -> None:
+        """Transcribe one silent window so lazy initialization (and CUDA graph capture) happens now."""
+        # Straight to the model: VAD would find nothing to transcribe in silence.
+        # Clips are never batched, so the batch size doesn't matter here.
+        self._run(model, np.zeros(Config.AUDIO_SAMPLE_RATE * Config.WHISPER_WINDOW_SECONDS, dtype=np.float32))
+
+
+class CudaGraphRunner:
+    """Replays a CUDA graph of a forward pass instead of launching its kernels one by one.
+
+    Whisper's encoder always sees the same padded 30 s input shape, and for the
+    small models kernel launch overhead dominates its run time. A graph is
+    captured the first time each input shape and dtype is seen. Calls made with
+    gradients enabled, or on CPU tensors, run the original forward.
+    """
+
+    WARMUP_RUNS = 3  # Capture needs the kernels' lazy initialization done beforehand
+
+    def __init__(self, forward):
+        self.forward = forward
+        self._graphs: Dict[tuple, tuple] = {}  # (shape, dtype, device) -> (graph, static input, static output)
+        # The model is shared by every worker on the device, and a graph's static
+        # buffers can only serve one call at a time
+        self._lock = threading.Lock()
+
+    def __call__(self, x):
+        if not x.is_cuda or torch.is_grad_enabled():
+            return self.forward(x)
+        key = (tuple(x.shape), x.dtype, x.device)
+        with self._lock:
+            if key not in self._graphs:
+                self._graphs[key] = self._capture(x)
+            graph, static_input, static_output = self._graphs[key]
+            static_input.copy_(x)
+            graph.replay()
+            # The next replay overwrites the static output
+            return static_output.clone()
+
+    def _capture(self, x):
+        static_input = x.clone()
+        side_stream = torch.cuda.Stream(device=x.device)
+        side_stream.wait_stream(torch.cuda.current_stream(x.device))
+        with torch.cuda.stream(side_stream):
+            for _ in range(self.WARMUP_RUNS):
+                self.forward(static_input)
+        torch.cuda.current_stream(x.device).wait_stream(side_stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_output = self.forward(static_input)
+        return graph, static_input, static_output
+
+
+class FasterWhisperBackend:
+    """CTranslate2 implementation from faster-whisper with quantized weights."""
+    name = "faster-whisper"
+    package = "faster-whisper"
+    supports_batching = True
+    pin_threads = False  # CTranslate2 runs its own thread pool, sized by cpu_threads instead
+
+    def __init__(self, compute_type: str = Config.DEFAULT_COMPUTE_TYPE, device: str = "auto", num_workers: int = 1):
+        self.compute_type = compute_type
+        self.device = device
+        self.num_workers = max(num_workers, 1)
+
+    def is_available(self) -> bool:
+        return faster_whisper is not None
+
+    def devices(self) -> List[str]:
+        # CTranslate2 picks CUDA itself when device is "auto"
+        return [self.device]
+
+    def uses_compute_type(self) -> bool:
+        return True
+
+    def load_model(self, model_name: str, device: Optional[str] = None):
+        # The model is shared by every worker. CTranslate2 serializes calls from
+        # different threads unless it has one internal worker per calling thread;
+        # the CPU cores are split between those workers.
+        return faster_whisper.WhisperModel(
+            model_name,
+            device=device or self.device,
+            compute_type=self.compute_type,
+            num_workers=self.num_workers,
+            cpu_threads=max((os.cpu_count() or 1) // self.num_workers, 1),
+        )
+
+    def transcribe(self, model, audio) -> str:
+        vad_parameters = dict(min_silence_duration_ms=Config.VAD_MIN_SILENCE_MS)
+        if len(audio) > model.feature_extractor.n_samples:
+            # VAD splits long recordings into independent speech chunks of up to 30 s,
+            # which are then decoded in batches instead of window after window
+            pipeline = faster_whisper.BatchedInferencePipeline(model)
+            segments, _ = pipeline.transcribe(
+                audio, beam_size=Config.BEAM_SIZE, vad_parameters=vad_parameters, batch_size=Config.CHUNK_BATCH_SIZE
+            )
+        else:
+            segments, _ = model.transcribe(audio, beam_size=Config.BEAM_SIZE, vad_filter=True, vad_parameters=vad_parameters)
+        return "".join(segment.text for segment in segments)
+
+    def transcribe_batch(self, model, audios: List[Any]) -> List[str]:
+        """Transcribe several clips, encoding and decoding those that fit one 30 s window together.
+
+        Silence is cut out first, so a clip qualifies by its speech length. Longer
+        clips need Whisper's sequential window-by-window decoding and are
+        transcribed one at a time.
+        """
+        window = model.feature_extractor.n_samples
+        speech = [self._speech_only(audio) for audio in audios]
+        texts: List[Optional[str]] = ["" if len(clip) == 0 else None for clip in speech]
+        short = [i for i, clip in enumerate(speech) if 0 < len(clip) <= window]
+        if len(short) > 1:
+            for i, text in zip(short, self._generate_batch(model, [speech[i] for i in short])):
+                texts[i] = text
+        for i, audio in enumerate(audios):
+            if texts[i] is None:
+                texts[i] = self.transcribe(model, audio)
+        return texts
+
+    def warm_up(self, model, batch_size: int = 1) -> None:
+        """Run a full batch of silent windows through the model so the first request
+        doesn't pay for lazy initialization and workspace allocation."""
+        # Straight to the encoder and decoder: VAD would find nothing to transcribe in silence
+        silence = np.zeros(model.feature_extractor.n_samples, dtype=np.float32)
+        self._generate_batch(model, [silence] * max(batch_size, 1))
+
+    @staticmethod
+    def _speech_only(audio):
+        """Concatenate the speech segments found by faster-whisper's Silero VAD."""
+        audio = np.asarray(audio, dtype=np.float32)
+        options = faster_whisper.vad.VadOptions(min_silence_duration_ms=Config.VAD_MIN_SILENCE_MS)
+        chunks = faster_whisper.vad.get_speech_timestamps(audio, options)
+        if not chunks:
+            return audio[:0]
+        return np.concatenate([audio[chunk["start"]:chunk["end"]] for chunk in chunks])
+
+    def _generate_batch(self, model, audios: List[Any]) -> List[str]:
+        """Run clips of at most 30 s through the CTranslate2 encoder and decoder as one batch."""
+        features = np.stack([
+            faster_whisper.audio.pad_or_trim(model.feature_extractor(audio), model.feature_extractor.nb_max_frames)
+            for audio in audios
+        ])
+        encoder_output = model.encode(features)
+
+        multilingual = model.model.is_multilingual
+        if multilingual:
+            # Each result lists (token, probability) pairs, most likely first, e.g. ("<|en|>", 0.98)
+            languages = [results[0][0][2:-2] for results in model.model.detect_language(encoder_output)]
+        else:
+            languages = [None] * len(audios)
+        tokenizers = [
+            faster_whisper.tokenizer.Tokenizer(model.hf_tokenizer, multilingual, task="transcribe", language=language)
+            for language in languages
+        ]
+
+        results = model.model.generate(
+            encoder_output,
+            [tokenizer.sot_sequence + [tokenizer.no_timestamps] for tokenizer in tokenizers],
+            beam_size=Config.BEAM_SIZE,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+        )
+        return [tokenizer.decode(result.sequences_ids[0]) for tokenizer, result in zip(tokenizers, results)]
+
+
+CPUINFO_PATH = "/proc/cpuinfo"
+
+
+def _has_cuda() -> bool:
+    """Whether CTranslate2 sees a CUDA GPU."""
+    return ctranslate2 is not None and ctranslate2.get_cuda_device_count() > 0
+
+
+def _pick_compute_type() -> str:
+    """Pick the compute type best suited to this machine.
+
+    CUDA GPUs get int8 weights with float16 activations. On CPU the choice follows
+    the /proc/cpuinfo flags: VNNI and AMX execute int8 matrix products natively, so
+    full int8 pays off. Plain AVX2 gets int8 weights with float32 activations, and
+    x86 CPUs without AVX2 lack fast int8 kernels altogether.
+    """
+    if _has_cuda():
+        return "int8_float16"
+    try:
+        with open(CPUINFO_PATH) as cpuinfo:
+            flags = next((set(line.split(":", 1)[1].split()) for line in cpuinfo if line.startswith("flags")), None)
+    except OSError:
+        flags = None
+    if flags is None:
+        # Not Linux on x86 (ARM lists "Features" instead), so nothing to specialize on
+        return Config.DEFAULT_COMPUTE_TYPE
+    if flags & {"avx512_vnni", "avx_vnni", "amx_int8"}:
+        return "int8"
+    if "avx2" in flags:
+        return "int8_float32"
+    return "float32"
+
+
+class WhisperCppBackend:
+    """whisper.cpp through pywhispercpp, for CPU-only and Apple Silicon hosts.
+
+    The model file fixes the weight precision: WHISPER_MODEL names a GGML model
+    such as "base" or "base-q8_0", or a path to one, and compute_type is unused.
+    """
+    name = "whispercpp"
+    package = "pywhispercpp"
+    supports_batching = False
+    pin_threads = True
+
+    def __init__(self, num_workers: int = 1):
+        self.num_workers = max(num_workers, 1)
+
+    def is_available(self) -> bool:
+        return whispercpp is not None
+
+    def devices(self) -> List[str]:
+        # A whisper.cpp context runs one transcription at a time, so every worker
+        # gets its own; GGML models are small enough to load once per worker
+        return [f"cpu:{index}" for index in range(self.num_workers)]
+
+    def uses_compute_type(self) -> bool:
+        # The GGML model file fixes the precision
+        return False
+
+    def load_model(self, model_name: str, device: str = "cpu"):
+        return whispercpp.Model(
+            model_name,
+            # Matches the slice of cores the transcription thread is pinned to
+            n_threads=max((os.cpu_count() or 1) // self.num_workers, 1),
+            no_context=True,  # Don't prompt each window with the previous one's text
+            print_progress=False,
+            print_realtime=False,
+        )
+
+    # whisper.cpp has no VAD of its own either
+    _speech_only = staticmethod(OpenAIWhisperBackend._speech_only)
+
+    def transcribe(self, model, audio) -> str:
+        audio = self._speech_only(audio)
+        if len(audio) == 0:
+            return ""
+        segments = model.transcribe(np.asarray(audio, dtype=np.float32))
+        return "".join(segment.text for segment in segments)
+
+    def transcribe_batch(self, model, audios: List[Any]) -> List[str]:
+        return [self.transcribe(model, audio) for audio in audios]
+
+    def warm_up(self, model, batch_size: int = 1) -> None:
+        """Transcribe one silent window, bypassing VAD, so buffers are allocated now."""
+        model.transcribe(np.zeros(Config.AUDIO_SAMPLE_RATE * Config.WHISPER_WINDOW_SECONDS, dtype=np.float32))
+
+
+def create_backend(name: str, compute_type: str = Config.DEFAULT_COMPUTE_TYPE, num_workers: int = 1,
+                   compile_encoder: bool = False) -> WhisperBackend:
+    """Create the Whisper backend registered under the given name."""
+    if name == FasterWhisperBackend.name:
+        return FasterWhisperBackend(compute_type=compute_type, num_workers=num_workers)
+    if name == OpenAIWhisperBackend.name:
+        return OpenAIWhisperBackend(compute_type=compute_type, compile_encoder=compile_encoder, num_workers=num_workers)
+    if name == WhisperCppBackend.name:
+        return WhisperCppBackend(num_workers=num_workers)
+    raise ValueError(f"Unknown Whisper backend '{name}'. Choose 'faster-whisper', 'openai' or 'whispercpp'.")
+
+
+# MP4-family containers may keep their index at the end of the file, so ffmpeg
+# needs a seekable file rather than a pipe to decode them
+NON_STREAMABLE_MIME_TYPES = {"audio/mp4", "audio/m4a", "audio/x-m4a", "audio/3gpp", "audio/3gpp2"}
+DOWNLOAD_CHUNK_SIZE = 512 * 1024  # Largest request size Telegram allows
+DECODE_READ_SIZE = 256 * 1024  # Bytes of ffmpeg output converted to samples at a time
+
+# RAM-backed filesystem for temporary downloads, so they never hit the disk
+SHM_DIR = "/dev/shm"
+
+# Extensions for the audio MIME types Telegram sends, so ffmpeg can pick the demuxer
+# without a lookup in the system mimetypes database
+MIME_EXTENSIONS = {
+    "audio/ogg": ".ogg",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/m4a": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "audio/3gpp": ".3gp",
+    "audio/3gpp2": ".3g2",
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/flac": ".flac",
+    "audio/aac": ".aac",
+    "audio/webm": ".webm",
+}
+
+
+async def decode_audio(source: Union[str, AsyncIterable[bytes]], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decode audio to mono float32 samples at Config.AUDIO_SAMPLE_RATE using ffmpeg.
+
+    source is either a file path or an async iterable of encoded bytes. Bytes are
+    streamed into ffmpeg's stdin, so decoding overlaps the download and nothing
+    is written to disk.
+
+    ffmpeg's output is converted as it is read, straight into out when given (a
+    larger array replaces it if it is too small). The result is a view of that
+    buffer, so the caller can reuse out's memory for the next file.
+    """
+    streaming = not isinstance(source, str)
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    cmd += ["-i", "pipe:0"] if streaming else ["-nostdin", "-i", source]
+    cmd += ["-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(Config.AUDIO_SAMPLE_RATE), "pipe:1"]
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if streaming else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed_stdin():
+        try:
+            async for chunk in source:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited early; its exit status reports why
+        finally:
+            proc.stdin.close()
+
+    async def read_samples():
+        samples = out if out is not None else np.empty(0, np.float32)
+        count = 0
+        leftover = b""  # Odd trailing byte of a read, completed by the next one
+        while chunk := await proc.stdout.read(DECODE_READ_SIZE):
+            if leftover:
+                chunk = leftover + chunk
+            usable = len(chunk) // 2 * 2
+            leftover = chunk[usable:]
+            pcm = np.frombuffer(chunk, np.int16, count=usable // 2)
+            if count + len(pcm) > len(samples):
+                grown = np.empty(max(count + len(pcm), 2 * len(samples)), np.float32)
+                grown[:count] = samples[:count]
+                samples = grown
+            np.multiply(pcm, 1 / 32768.0, out=samples[count:count + len(pcm)])
+            count += len(pcm)
+        return samples[:count]
+
+    try:
+        reads = [read_samples(), proc.stderr.read()]
+        if streaming:
+            _, samples, stderr = await asyncio.gather(feed_stdin(), *reads)
+        else:
+            samples, stderr = await asyncio.gather(*reads)
+        await proc.wait()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode audio: {stderr.decode(errors='replace').strip()}")
+
+    return samples
+
+
+async def iter_download_parallel(bot: BotProtocol, media, file_size: int) -> AsyncIterable[bytes]:
+    """Download a file as several concurrent ranged requests, yielding its bytes in order.
+
+    A single iter_download waits for each request before sending the next, so
+    large files are limited by round trips rather than bandwidth. Here up to
+    Config.PARALLEL_DOWNLOADS segments are in flight, and only those are held in
+    memory.
+    """
+    segment_size = DOWNLOAD_CHUNK_SIZE * Config.DOWNLOAD_SEGMENT_CHUNKS
+
+    async def fetch(offset: int) -> List[bytes]:
+        return [
+            chunk async for chunk in bot.iter_download(
+                media, offset=offset, limit=Config.DOWNLOAD_SEGMENT_CHUNKS, request_size=DOWNLOAD_CHUNK_SIZE
+            )
+        ]
+
+    offsets = iter(range(0, file_size, segment_size))
+    in_flight = deque(asyncio.create_task(fetch(offset)) for offset in itertools.islice(offsets, Config.PARALLEL_DOWNLOADS))
+    try:
+        while in_flight:
+            chunks = await in_flight.popleft()
+            offset = next(offsets, None)
+            if offset is not None:
+                in_flight.append(asyncio.create_task(fetch(offset)))
+            for chunk in chunks:
+                yield chunk
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def _temp_dir_for(file_size: int) -> Optional[str]:
+    """Pick tmpfs for a temporary download when it has room, else the default temp dir."""
+    if os.path.isdir(SHM_DIR) and shutil.disk_usage(SHM_DIR).free > file_size:
+        return SHM_DIR
+    return None
+
+
+def _pin_thread_to_cpu_slice(slice_counter, num_slices: int):
+    """Pin the calling thread to its own contiguous slice of the available CPUs (Linux only).
+
+    Only threads started from the pinned one inherit the slice, so this does
+    nothing for libraries that compute on a thread pool of their own.
+    """
+    if num_slices < 2 or not hasattr(os, "sched_setaffinity"):
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    per_slice = len(cpus) // num_slices
+    if per_slice == 0:
+        return
+    index = next(slice_counter) % num_slices
+    os.sched_setaffinity(0, cpus[index * per_slice:(index + 1) * per_slice])
+
+
+class JobQueue(asyncio.PriorityQueue):
+    """Queue of jobs that hands out the smallest file first, FIFO among equal sizes.
+
+    A short voice message no longer waits behind a long recording queued before
+    it. put() and get() take and return plain jobs.
+    """
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._order = itertools.count()  # Tiebreaker, so equal sizes never compare jobs
+        self._sizes: List[int] = []  # Queued file sizes in ascending order, for count_at_most()
+        self._watchers: List[asyncio.Future] = []  # wait_for_job() callers to wake on the next put
+
+    def _put(self, job: Job):
+        super()._put((job.file_size, next(self._order), job))
+        bisect.insort(self._sizes, job.file_size)
+        for watcher in self._watchers:
+            if not watcher.done():
+                watcher.set_result(None)
+        self._watchers.clear()
+
+    def _get(self) -> Job:
+        job = super()._get()[-1]
+        del self._sizes[bisect.bisect_left(self._sizes, job.file_size)]
+        return job
+
+    def count_at_most(self, file_size: int) -> int:
+        """Number of queued jobs whose file is no larger than file_size, in O(log n)."""
+        return bisect.bisect_right(self._sizes, file_size)
+
+    def peek(self) -> Optional[Job]:
+        """Return the job get() would hand out next, without taking it."""
+        return self._queue[0][-1] if self._queue else None
+
+    async def wait_for_job(self):
+        """Wait until the queue holds a job, without taking it.
+
+        Lets a consumer peek() before deciding whether to get(), so a job it
+        can't use never leaves the queue. Another consumer may still take the
+        job first, so check again after waking.
+        """
+        while self.empty():
+            watcher = asyncio.get_running_loop().create_future()
+            self._watchers.append(watcher)
+            try:
+                await watcher
+            finally:
+                if watcher in self._watchers:
+                    self._watchers.remove(watcher)
+
+
+class StatusPinger:
+    """Debounced status updates for a job's processing message.
+
+    set() only records the latest text. It is sent as an edit once it has stayed
+    unchanged for `delay` seconds, so stages that finish quickly never cost a
+    Telegram round trip.
+    """
+
+    def __init__(self, bot: BotProtocol, chat_id: int, message_id: int, delay: float = Config.STATUS_DEBOUNCE_SECONDS):
+        self.bot = bot
+        self._edit = bot.edit_message  # Bound once; a job may send several updates
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.delay = delay
+        self._task: Optional[asyncio.Task] = None
+        self._shown: Optional[str] = None  # Text of the last successful edit
+        self.logger = logging.getLogger(__name__)
+
+    def set(self, text: str):
+        """Replace the pending status text and restart the debounce timer."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if text != self._shown:
+            self._task = asyncio.create_task(self._send_later(text))
+
+    async def _send_later(self, text: str):
+        await asyncio.sleep(self.delay)
+        try:
+            await self._edit(entity=self.chat_id, message=self.message_id, text=text)
+            self._shown = text
+        except Exception as e:
+            self.logger.warning("Failed to update status for chat %s: %s", self.chat_id, e)
+
+    def close(self):
+        """Drop any pending update; the processing message is about to be replaced or deleted."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
 
 
 class AudioMessage:
-    def __init__(self, file_id: str, file_size: int, mime_type: str, file_name: Optional[str] = None, file_unique_id: str = "test"):
+    __slots__ = ("file_id", "file_size", "mime_type", "file_name", "file_unique_id", "duration")
+
+    def __init__(self, file_id: str, file_size: int, mime_type: str, file_name: Optional[str] = None, file_unique_id: Optional[str] = None,
+                 duration: Optional[float] = None):
         self.file_id = file_id
         self.file_size = file_size
         self.mime_type = mime_type
         self.file_name = file_name
-        self.file_unique_id = file_unique_id
+        self.file_unique_id = file_unique_id  # Transcript cache key; None skips the cache
+        self.duration = duration  # Seconds, from Telegram's metadata when the client provided it
 
 
 class BotCore:
+    # Whisper models are loaded once per process and shared by every worker.
+    _MODEL_CACHE: Dict[tuple, Any] = {}  # (backend, model name, compute type, device) -> model instance
+    _MODEL_LOCK = threading.Lock()
+
     def __init__(self, 
                  whisper_model: str = "base",
                  num_workers: int = 2,
                  max_file_size: int = 2 * 1024 * 1024 * 1024,  # 2GB
                  max_queue_size: int = 100,
-                 max_jobs_per_user_in_queue: int = 2):
+                 max_jobs_per_user_in_queue: int = 2,
+                 backend: str = Config.DEFAULT_WHISPER_BACKEND,
+                 compute_type: Optional[str] = None,
+                 max_batch_size: int = Config.DEFAULT_MAX_BATCH_SIZE,
+                 transcript_cache_size: int = Config.DEFAULT_TRANSCRIPT_CACHE_SIZE,
+                 compile_encoder: bool = False):
         self.whisper_model = whisper_model
+        self.logger = logging.getLogger(__name__)
+        self.backend = create_backend(backend, compute_type or Config.DEFAULT_COMPUTE_TYPE, num_workers, compile_encoder)
+        # Probe the hardware only for backends that act on the compute type, so the log never
+        # reports a setting that has no effect
+        if not compute_type and self.backend.uses_compute_type():
+            compute_type = self.backend.compute_type = _pick_compute_type()
+            self.logger.info("Using compute type '%s' picked for %s", compute_type, "the CUDA GPU" if _has_cuda() else "this CPU")
+        self._model_key = (backend, whisper_model, compute_type)
+        self._device_counter = itertools.count()
         self.num_workers = num_workers
         self.max_file_size = max_file_size
         self.max_queue_size = max_queue_size
         self.max_jobs_per_user_in_queue = max_jobs_per_user_in_queue
-        self.processing_queue = asyncio.Queue()
-        self.models: Dict[str, Any] = {}  # worker_name -> model instance
-        self.logger = logging.getLogger(__name__)
+        # Backends that transcribe a batch clip by clip gain nothing from waiting for one
+        self.max_batch_size = max(max_batch_size, 1) if self.backend.supports_batching else 1
+        self.transcript_cache_size = transcript_cache_size
+        self.status_debounce_seconds = Config.STATUS_DEBOUNCE_SECONDS
+        self.delete_batch_seconds = Config.DELETE_BATCH_SECONDS
+        # chat_id -> (processing message ids, task deleting them once the window closes)
+        self._pending_deletes: Dict[int, Tuple[List[int], asyncio.Task]] = {}
+        # Running deletion tasks; the event loop only keeps weak references to tasks
+        self._delete_tasks: Set[asyncio.Task] = set()
+        # LRU of file_unique_id -> transcription, so duplicate files skip download and transcription
+        self._transcript_cache: OrderedDict[str, str] = OrderedDict()
+        # Decoded-sample buffers handed back after transcription, reused for later downloads
+        self._decode_buffers: List[np.ndarray] = []
+        # Bounded, so put_nowait() enforces max_queue_size atomically
+        self.processing_queue = JobQueue(maxsize=max_queue_size)
         
-        # Rate limiting tracking - jobs in queue per user
+        # Rate limiting tracking - jobs in queue per user. Only touched from the event
+        # loop thread, so plain dict operations need no thread lock.
         self.user_queue_count: Dict[int, int] = defaultdict(int)
-        self._rate_limit_lock = threading.Lock()
+
+        # Dedicated pool so transcriptions never compete with other to_thread work
+        # for slots in the event loop's default executor
+        pool_size = max(num_workers, 1)
+        num_slices = pool_size if self.backend.pin_threads else 1
+        self._transcribe_pool = ThreadPoolExecutor(
+            max_workers=pool_size,
+            thread_name_prefix="whisper",
+            initializer=_pin_thread_to_cpu_slice,
+            initargs=(itertools.count(), num_slices),
+        )
         
     def get_worker_model(self, worker_name: str):
-        """Get or load Whisper model for a specific worker."""
-        if worker_name not in self.models:
-            if whisper is None:
-                self.logger.error(f"Whisper not available for {worker_name} - install openai-whisper package")
-                return None
-                
-            try:
-                self.logger.info(f"Loading Whisper model '{self.whisper_model}' for {worker_name}")
-                self.models[worker_name] = whisper.load_model(self.whisper_model)
-                self.logger.info(f"Model loaded successfully for {worker_name}")
-            except Exception as e:
-                self.logger.error(f"Could not load Whisper model for {worker_name}: {e}")
-                return None
-        
-        return self.models[worker_name]
+        """Get the shared Whisper model for a worker, loading it on first use.
+
+        Workers are assigned round-robin to the backend's devices, with one model
+        loaded per device and shared by every worker on it.
+        """
+        if not self.backend.is_available():
+            self.logger.error("Whisper not available for %s - install %s package", worker_name, self.backend.package)
+            return None
+
+        devices = self.backend.devices()
+        device = devices[next(self._device_counter) % len(devices)]
+        key = (*self._model_key, device)
+
+        model = self._MODEL_CACHE.get(key)
+        if model is not None:
+            return model
+
+        with self._MODEL_LOCK:
+            # Another worker may have finished loading while we waited
+            model = self._MODEL_CACHE.get(key)
+            if model is None:
+                try:
+                    self.logger.info("Loading %s Whisper model '%s' on %s for %s", self.backend.name, self.whisper_model, device, worker_name)
+                    model = self.backend.load_model(self.whisper_model, device)
+                    self._MODEL_CACHE[key] = model
+                    self.logger.info("Model loaded successfully for %s", worker_name)
+                except Exception as e:
+                    self.logger.error("Could not load Whisper model for %s: %s", worker_name, e)
+                    return None
+                self._warm_up(model, worker_name)
+
+        return model
+
+    def _warm_up(self, model, worker_name: str):
+        """Run a dummy transcription on a freshly loaded model.
+
+        Called with the model lock held, so the workers sharing the model only
+        pick up jobs once it is warm. A failure here is logged and left for the
+        first real request to run into.
+        """
+        try:
+            self.backend.warm_up(model, self.max_batch_size)
+            self.logger.info("Model warmed up for %s", worker_name)
+        except Exception as e:
+            self.logger.warning("Model warm-up failed for %s: %s", worker_name, e)
 
     def validate_audio_file(self, audio: AudioMessage) -> Optional[str]:
-        """Validate audio file size. Returns error message if invalid, None if valid."""
+        """Validate audio file size and duration metadata. Returns error message if invalid, None if valid."""
         if audio.file_size > self.max_file_size:
             return "File is too large. The limit is 2 GB."
+        # Reject clips Telegram already reports as too short, before any download or decode.
+        # A duration of 0 means the client didn't measure it; the decoded length is checked later.
+        if audio.duration and audio.duration < Config.MIN_AUDIO_DURATION:
+            return f"The audio file is too short to transcribe (less than {Config.MIN_AUDIO_DURATION} seconds)."
         return None
 
     def is_queue_full(self) -> bool:
         """Check if the processing queue is at capacity."""
-        return self.processing_queue.qsize() >= self.max_queue_size
+        return self.processing_queue.full()
+
+    def get_queue_position(self, file_size: Optional[int] = None) -> int:
+        """Get the number of queued jobs ahead of a new file of the given size.
 
-    def get_queue_position(self) -> int:
-        """Get the current queue size (position for next item)."""
-        return self.processing_queue.qsize()
+        Smaller files are handed out first, so only queued files at most as large
+        count; without a size this is the whole queue.
+        """
+        if file_size is None:
+            return self.processing_queue.qsize()
+        # Equal sizes stay FIFO, so those already queued are ahead too
+        return self.processing_queue.count_at_most(file_size)
     
+    def _peek_last_queued(self) -> Optional[Job]:
+        """Return the most recently queued job without taking it off the queue (for tests)."""
+        # Heap entries are (file_size, insertion counter, job)
+        entries = self.processing_queue._queue
+        return max(entries, key=lambda entry: entry[1])[-1] if entries else None
+
+    def check_admission(self, chat_id: int) -> Optional[str]:
+        """Check the queue capacity and the user's job limit. Returns error message if a job would be refused, None if it fits."""
+        if self.is_queue_full():
+            return self._queue_full_message()
+
+        if not self.can_user_submit_job(chat_id):
+            current_count = self.get_user_queue_count(chat_id)
+            return f"You have reached the maximum limit of {self.max_jobs_per_user_in_queue} audio files in the queue. Please wait for your current jobs to complete. (Currently in queue: {current_count})"
+        return None
+
+    def _queue_full_message(self) -> str:
+        return f"Sorry, the processing queue is full ({self.max_queue_size} files). Please try again later."
+
     def can_user_submit_job(self, chat_id: int) -> bool:
         """Check if user is within their queue job limit."""
-        with self._rate_limit_lock:
-            current_count = self.user_queue_count[chat_id]
-            return current_count < self.max_jobs_per_user_in_queue
+        return self.user_queue_count.get(chat_id, 0) < self.max_jobs_per_user_in_queue
     
     def increment_user_queue_count(self, chat_id: int) -> int:
         """Increment user's queued job count and return new count."""
-        with self._rate_limit_lock:
-            self.user_queue_count[chat_id] += 1
-            new_count = self.user_queue_count[chat_id]
-            self.logger.debug(f"User {chat_id} now has {new_count} jobs in queue")
-            return new_count
+        self.user_queue_count[chat_id] += 1
+        new_count = self.user_queue_count[chat_id]
+        self.logger.debug("User %s now has %s jobs in queue", chat_id, new_count)
+        return new_count
     
     def decrement_user_queue_count(self, chat_id: int) -> int:
         """Decrement user's queued job count and return new count."""
-        with self._rate_limit_lock:
-            if self.user_queue_count[chat_id] > 0:
-                self.user_queue_count[chat_id] -= 1
-            new_count = self.user_queue_count[chat_id]
-            
-            # Clean up zero counts to prevent memory leaks
-            if new_count == 0:
-                del self.user_queue_count[chat_id]
-            
-            self.logger.debug(f"User {chat_id} now has {new_count} jobs in queue")
-            return new_count
+        new_count = max(self.user_queue_count.get(chat_id, 0) - 1, 0)
+        
+        # Clean up zero counts to prevent memory leaks
+        if new_count == 0:
+            self.user_queue_count.pop(chat_id, None)
+        else:
+            self.user_queue_count[chat_id] = new_count
+        
+        self.logger.debug("User %s now has %s jobs in queue", chat_id, new_count)
+        return new_count
     
     def get_user_queue_count(self, chat_id: int) -> int:
         """Get current number of queued jobs for a user."""
-        with self._rate_limit_lock:
-            return self.user_queue_count[chat_id]
+        return self.user_queue_count.get(chat_id, 0)
 
-    async def queue_audio_job(self, chat_id: int, message_id: int, audio: AudioMessage, processing_msg_id: int) -> tuple[bool, Optional[str]]:
-        """Queue an audio processing job. Returns (success, error_message)."""
-        if self.is_queue_full():
-            return False, f"Sorry, the processing queue is full ({self.max_queue_size} files). Please try again later."
+    def get_cached_transcription(self, file_unique_id: Optional[str]) -> Optional[str]:
+        """Return the cached transcription for a file, marking it as recently used."""
+        if file_unique_id is None or file_unique_id not in self._transcript_cache:
+            return None
+        self._transcript_cache.move_to_end(file_unique_id)
+        return self._transcript_cache[file_unique_id]
 
-        # Check rate limit
-        if not self.can_user_submit_job(chat_id):
-            current_count = self.get_user_queue_count(chat_id)
-            return False, f"You have reached the maximum limit of {self.max_jobs_per_user_in_queue} audio files in the queue. Please wait for your current jobs to complete. (Currently in queue: {current_count})"
+    def cache_transcription(self, file_unique_id: Optional[str], transcription: str):
+        """Remember a transcription, evicting the least recently used one when full."""
+        if file_unique_id is None or self.transcript_cache_size <= 0:
+            return
+        self._transcript_cache[file_unique_id] = transcription
+        self._transcript_cache.move_to_end(file_unique_id)
+        while len(self._transcript_cache) > self.transcript_cache_size:
+            self._transcript_cache.popitem(last=False)
 
+    async def queue_audio_job(self, chat_id: int, message_id: int, audio: AudioMessage, processing_msg_id: int) -> tuple[bool, Optional[str]]:
+        """Queue an audio processing job. Returns (success, error_message)."""
         # Determine filename
         file_name = audio.file_name
         if not file_name:
             if audio.mime_type == "audio/ogg":
                 file_name = "voice_message.ogg"
             else:
-                file_name = f"audio_file_{audio.file_unique_id}.{audio.mime_type.split('/')[1]}"
-
-        # Increment user queue count before queueing
-        self.increment_user_queue_count(chat_id)
+                file_name = f"audio_file_{audio.file_unique_id or audio.file_id}.{audio.mime_type.split('/')[1]}"
 
         job = Job(
             chat_id=chat_id,
@@ -180,122 +979,308 @@ class BotCore:
             mime_type=audio.mime_type,
             file_size=audio.file_size,
             processing_msg_id=processing_msg_id,
+            file_unique_id=audio.file_unique_id,
+            duration=audio.duration,
         )
 
-        await self.processing_queue.put(job)
-        self.logger.info(f"Job added to queue for chat {job.chat_id}. Queue size: {self.processing_queue.qsize()}")
+        # Nothing below awaits until the job is queued, so concurrent submissions can't
+        # interleave between the checks and the put and both pass the caps
+        error = self.check_admission(chat_id)
+        if error:
+            return False, error
+
+        try:
+            self.processing_queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False, self._queue_full_message()
+        self.increment_user_queue_count(chat_id)
+
+        self.logger.info("Job added to queue for chat %s. Queue size: %s", job.chat_id, self.processing_queue.qsize())
         return True, None
 
     async def complete_job(self, job: Job):
         """Mark a job as complete and decrement user queue count."""
         self.decrement_user_queue_count(job.chat_id)
-        self.logger.info(f"Job completed for user {job.chat_id}")
+        self.logger.info("Job completed for user %s", job.chat_id)
+
+    async def next_batch(self) -> List[Job]:
+        """Wait for a job, then collect any others that arrive shortly after, up to max_batch_size.
+
+        Only clips Telegram reports as fitting one Whisper window are coalesced;
+        anything longer is returned alone, and one arriving while the batch is
+        being collected is left in the queue for another worker.
+        """
+        jobs = [await self.processing_queue.get()]
+        if not self._is_batchable(jobs[0]):
+            return jobs
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.BATCH_WAIT_SECONDS
+        while len(jobs) < self.max_batch_size:
+            if not self.processing_queue.empty():
+                if not self._is_batchable(self.processing_queue.peek()):
+                    break
+                jobs.append(self.processing_queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                # Only wait for a job here; it is taken above once peek() shows it fits
+                await asyncio.wait_for(self.processing_queue.wait_for_job(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    @staticmethod
+    def _is_batchable(job: Job) -> bool:
+        return job.duration is not None and job.duration <= Config.WHISPER_WINDOW_SECONDS
 
     async def process_audio_job(self, job: Job, bot: BotProtocol, model) -> bool:
         """Process a single audio job. Returns True if successful, False if failed."""
+        status = self._status_pinger(job, bot)
         try:
-            # Check file size before downloading
-            if job.file_size > self.max_file_size:
-                await bot.edit_message(
-                    entity=job.chat_id,
-                    message=job.processing_msg_id,
-                    text="File is too large. The limit is 2 GB.",
-                )
-                return False
+            finished, audio = await self._prepare_audio(job, bot, status)
+            if finished is not None:
+                return finished
+
+            duration = len(audio) / Config.AUDIO_SAMPLE_RATE
+            self.logger.info("Starting transcription for %s (duration: %.2fs)", job.file_name, duration)
+            # Transcribe the samples already decoded above instead of decoding the file again
+            transcription = await self._transcribe(model, audio)
+            self.logger.info("Finished transcription for %s", job.file_name)
+            self._release_decode_buffer(audio)
+
+            await self._finish_job(job, bot, transcription)
+            return True
+
+        except Exception as e:
+            return await self._fail_job(job, bot, e)
+
+        finally:
+            status.close()
+
+    async def process_batch(self, jobs: List[Job], bot: BotProtocol, model) -> List[bool]:
+        """Process several jobs, transcribing their audio in one batched model call.
+
+        Returns one success flag per job, in the order given.
+        """
+        if len(jobs) == 1:
+            return [await self.process_audio_job(jobs[0], bot, model)]
+
+        results: List[Optional[bool]] = [None] * len(jobs)
+        ready = []  # (index, job, audio) for jobs that still need transcribing
+        statuses = [self._status_pinger(job, bot) for job in jobs]
+
+        async def prepare(index: int, job: Job):
+            try:
+                finished, audio = await self._prepare_audio(job, bot, statuses[index])
+            except Exception as e:
+                results[index] = await self._fail_job(job, bot, e)
+                return
+            if finished is not None:
+                results[index] = finished
+            else:
+                ready.append((index, job, audio))
+
+        try:
+            await asyncio.gather(*(prepare(index, job) for index, job in enumerate(jobs)))
+            if not ready:
+                return results
 
+            # next_batch only coalesces clips Telegram reports as fitting one window; the
+            # backend trims silence and qualifies each clip by its speech length
+            transcriptions: List[Optional[str]] = [None] * len(ready)
+            if len(ready) > 1:
+                self.logger.info("Starting batched transcription of %s files", len(ready))
+                try:
+                    transcriptions = await self._transcribe_batch(model, [audio for _, _, audio in ready])
+                except Exception as e:
+                    # Fall back to one file at a time so a single bad file doesn't fail the whole batch
+                    self.logger.warning("Batched transcription failed, retrying files individually: %s", e)
+
+            for (index, job, audio), transcription in zip(ready, transcriptions):
+                try:
+                    if transcription is None:
+                        transcription = await self._transcribe(model, audio)
+                    self.logger.info("Finished transcription for %s", job.file_name)
+                    await self._finish_job(job, bot, transcription)
+                    results[index] = True
+                except Exception as e:
+                    results[index] = await self._fail_job(job, bot, e)
+                else:
+                    self._release_decode_buffer(audio)
+
+            return results
+
+        finally:
+            for status in statuses:
+                status.close()
+
+    def _status_pinger(self, job: Job, bot: BotProtocol) -> StatusPinger:
+        return StatusPinger(bot, job.chat_id, job.processing_msg_id, self.status_debounce_seconds)
+
+    async def _prepare_audio(self, job: Job, bot: BotProtocol, status: StatusPinger) -> tuple[Optional[bool], Any]:
+        """Download, decode and validate a job's audio.
+
+        Returns (None, audio) if the audio is ready to transcribe, or (success, None)
+        if the job was already answered (file too large, empty, too short or cached).
+        """
+        # Check file size before downloading
+        if job.file_size > self.max_file_size:
             await bot.edit_message(
                 entity=job.chat_id,
                 message=job.processing_msg_id,
-                text="Downloading your audio file...",
+                text="File is too large. The limit is 2 GB.",
             )
+            return False, None
 
-            # Download file only when ready to process
-            self.logger.info(f"Downloading file for {job.file_name}")
-            original_message = await bot.get_messages(job.chat_id, ids=job.message_id)
-
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_ext = mimetypes.guess_extension(job.mime_type) or ".ogg"
-                temp_path = os.path.join(temp_dir, f"audio{file_ext}")
-                await original_message.download_media(temp_path)
-                self.logger.info(f"Finished downloading {job.file_name}")
+        # Forwarded or re-sent files keep their file_unique_id, so reuse earlier work
+        cached = self.get_cached_transcription(job.file_unique_id)
+        if cached is not None:
+            self.logger.info("Using cached transcription for %s", job.file_name)
+            await self._send_transcription_result(job, bot, cached)
+            await self.complete_job(job)
+            return True, None
 
-                await bot.edit_message(
-                    entity=job.chat_id,
-                    message=job.processing_msg_id,
-                    text="Analyzing audio duration...",
-                )
+        status.set("Downloading your audio file...")
 
-                if whisper is None:
-                    raise ImportError("Whisper not available - install openai-whisper package")
-                
-                audio = whisper.load_audio(temp_path)
-                duration = len(audio) / Config.AUDIO_SAMPLE_RATE  # Convert samples to seconds
-                
-                # Validate audio has content
-                if len(audio) == 0:
-                    self.logger.warning(f"Empty audio file: {job.file_name}")
-                    await bot.send_message(
-                        entity=job.chat_id,
-                        message="The audio file appears to be empty or corrupted.",
-                        reply_to=job.message_id,
-                    )
-                    return True
-                
-                # Check for very short audio
-                if duration < Config.MIN_AUDIO_DURATION:
-                    self.logger.warning(f"Very short audio file ({duration:.2f}s): {job.file_name}")
-                    await bot.send_message(
-                        entity=job.chat_id,
-                        message=f"The audio file is too short to transcribe (less than {Config.MIN_AUDIO_DURATION} seconds).",
-                        reply_to=job.message_id,
-                    )
-                    return True
-                
-                estimated_seconds = max(duration / 60 * Config.TRANSCRIPTION_TIME_FACTOR, 2)
-
-                await bot.edit_message(
-                    entity=job.chat_id,
-                    message=job.processing_msg_id,
-                    text=f"Processing your audio. Estimated time: {estimated_seconds:1.0f} seconds.",
-                )
+        # Download file only when ready to process
+        self.logger.info("Downloading file for %s", job.file_name)
+        original_message = await bot.get_messages(job.chat_id, ids=job.message_id)
 
-                self.logger.info(f"Starting transcription for {job.file_name} (duration: {duration:.2f}s)")
-                # Each worker has its own model for thread safety
-                result = await asyncio.to_thread(model.transcribe, temp_path)
-                transcription = result["text"]
-                self.logger.info(f"Finished transcription for {job.file_name}")
+        if (job.mime_type in NON_STREAMABLE_MIME_TYPES and faster_whisper is not None
+                and job.file_size <= Config.MAX_IN_MEMORY_DECODE_SIZE):
+            # MP4-family containers need seeking, which an in-memory file allows: decode
+            # in-process with PyAV (a faster-whisper dependency), without ffmpeg or a temp file.
+            # The whole file is held in memory, so only small files take this path.
+            data = await original_message.download_media(bytes)
+            audio = await asyncio.to_thread(
+                faster_whisper.decode_audio, io.BytesIO(data), sampling_rate=Config.AUDIO_SAMPLE_RATE
+            )
+            del data
+        elif job.mime_type in NON_STREAMABLE_MIME_TYPES:
+            file_ext = MIME_EXTENSIONS.get(job.mime_type, ".ogg")
+            with tempfile.NamedTemporaryFile(dir=_temp_dir_for(job.file_size), suffix=file_ext) as temp_file:
+                await original_message.download_media(temp_file.name)
+                audio = await decode_audio(temp_file.name, self._take_decode_buffer())
+        else:
+            # Stream the download straight into ffmpeg, fetching large files in parallel ranges
+            if job.file_size > DOWNLOAD_CHUNK_SIZE * Config.DOWNLOAD_SEGMENT_CHUNKS:
+                chunks = iter_download_parallel(bot, original_message.media, job.file_size)
+            else:
+                chunks = bot.iter_download(original_message.media, request_size=DOWNLOAD_CHUNK_SIZE)
+            audio = await decode_audio(chunks, self._take_decode_buffer())
+        self.logger.info("Finished downloading and decoding %s", job.file_name)
 
-            await self._send_transcription_result(job, bot, transcription)
+        duration = len(audio) / Config.AUDIO_SAMPLE_RATE  # Convert samples to seconds
+        
+        # Validate audio has content
+        if len(audio) == 0:
+            self.logger.warning("Empty audio file: %s", job.file_name)
+            self._release_decode_buffer(audio)
+            await bot.send_message(
+                entity=job.chat_id,
+                message="The audio file appears to be empty or corrupted.",
+                reply_to=job.message_id,
+            )
             await self.complete_job(job)
-            return True
-
-        except Exception as e:
-            self.logger.error(f"Failed processing job for chat {job.chat_id}: {e}", exc_info=True)
-            await self._send_error_message(job, bot, e)
+            return True, None
+        
+        # Check for very short audio; metadata may have been missing or wrong at queue time
+        if duration < Config.MIN_AUDIO_DURATION:
+            self.logger.warning("Very short audio file (%.2fs): %s", duration, job.file_name)
+            self._release_decode_buffer(audio)
+            await bot.send_message(
+                entity=job.chat_id,
+                message=f"The audio file is too short to transcribe (less than {Config.MIN_AUDIO_DURATION} seconds).",
+                reply_to=job.message_id,
+            )
             await self.complete_job(job)
-            return False
+            return True, None
+        
+        estimated_seconds = max(duration / 60 * Config.TRANSCRIPTION_TIME_FACTOR, 2)
+
+        status.set(f"Processing your audio. Estimated time: {estimated_seconds:1.0f} seconds.")
+
+        return None, audio
+
+    def _take_decode_buffer(self) -> Optional[np.ndarray]:
+        """Reuse a decode buffer left by an earlier job, if one is free."""
+        return self._decode_buffers.pop() if self._decode_buffers else None
+
+    def _release_decode_buffer(self, audio):
+        """Keep the buffer behind decoded audio for the next download, once nothing reads it."""
+        buffer = getattr(audio, "base", None)
+        if not isinstance(buffer, np.ndarray):
+            return
+        keep = self.num_workers * self.max_batch_size
+        if len(buffer) > Config.MAX_REUSED_DECODE_SECONDS * Config.AUDIO_SAMPLE_RATE or len(self._decode_buffers) >= keep:
+            return
+        # Buffers grow to the longest clip they have held, so bound the bytes kept as well as the count
+        if sum(kept.nbytes for kept in self._decode_buffers) + buffer.nbytes <= Config.MAX_REUSED_DECODE_BYTES:
+            self._decode_buffers.append(buffer)
+
+    async def _finish_job(self, job: Job, bot: BotProtocol, transcription: str):
+        """Send a finished transcription, cache it and release the job's queue slot."""
+        await self._send_transcription_result(job, bot, transcription)
+        self.cache_transcription(job.file_unique_id, transcription)
+        await self.complete_job(job)
+
+    async def _fail_job(self, job: Job, bot: BotProtocol, error: Exception) -> bool:
+        """Report a failed job to the user and release its queue slot. Always returns False."""
+        self.logger.error("Failed processing job for chat %s: %s", job.chat_id, error, exc_info=True)
+        await self._send_error_message(job, bot, error)
+        await self.complete_job(job)
+        return False
+
+    async def _transcribe(self, model, audio) -> str:
+        """Run the blocking transcription on the dedicated transcription pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._transcribe_pool, self.backend.transcribe, model, audio)
+
+    async def _transcribe_batch(self, model, audios: List[Any]) -> List[str]:
+        """Run a blocking batched transcription on the dedicated transcription pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._transcribe_pool, self.backend.transcribe_batch, model, audios)
 
     async def _send_transcription_result(self, job: Job, bot: BotProtocol, transcription: str):
         """Send transcription result to user, splitting into chunks if necessary."""
+        send = bot.send_message  # Bound once for every chunk below
         header = "Transcription:\n\n"
-        max_length = Config.TELEGRAM_MESSAGE_LIMIT
+        step = Config.TELEGRAM_MESSAGE_LIMIT - len(header)
 
         if not transcription.strip():
-            await bot.send_message(
+            await send(
                 entity=job.chat_id,
                 message="The audio contained no detectable speech.",
                 reply_to=job.message_id,
             )
-        else:
-            # Split into chunks and send
-            for i in range(0, len(transcription), max_length - len(header)):
-                chunk = transcription[i : i + max_length - len(header)]
-                await bot.send_message(
+            return
+
+        if len(transcription) <= step:
+            await send(
+                entity=job.chat_id,
+                message=header + transcription,
+                reply_to=job.message_id,
+            )
+            return
+
+        # Chunks are sent concurrently and may arrive out of order, so number them
+        step -= len("[9999/9999] ")
+        starts = range(0, len(transcription), step)
+        total = len(starts)
+        semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_SENDS)
+
+        async def send_chunk(number: int, start: int):
+            async with semaphore:
+                await send(
                     entity=job.chat_id,
-                    message=f"{header}{chunk}",
+                    message=f"[{number}/{total}] {header}{transcription[start : start + step]}",
                     reply_to=job.message_id,
                 )
 
+        await asyncio.gather(*(send_chunk(number, start) for number, start in enumerate(starts, 1)))
+
     async def _send_error_message(self, job: Job, bot: BotProtocol, error: Exception):
         """Send appropriate error message to user based on error type."""
         try:
@@ -316,11 +1301,28 @@ class BotCore:
                 reply_to=job.message_id,
             )
         except Exception as notify_error:
-            self.logger.error(f"Failed to notify user {job.chat_id} about error: {notify_error}")
+            self.logger.error("Failed to notify user %s about error: %s", job.chat_id, notify_error)
+
+    def cleanup_processing_message(self, job: Job, bot: BotProtocol) -> asyncio.Task:
+        """Schedule deletion of the processing status message and return without waiting.
+
+        Deletions for one chat that arrive within delete_batch_seconds of each
+        other, as when a batch finishes, are sent as a single request. Returns the
+        task sending it, for callers that want to wait.
+        """
+        pending = self._pending_deletes.get(job.chat_id)
+        if pending is None:
+            flush = asyncio.create_task(self._delete_pending(job.chat_id, bot))
+            self._delete_tasks.add(flush)
+            flush.add_done_callback(self._delete_tasks.discard)
+            pending = self._pending_deletes[job.chat_id] = ([], flush)
+        pending[0].append(job.processing_msg_id)
+        return pending[1]
 
-    async def cleanup_processing_message(self, job: Job, bot: BotProtocol):
-        """Clean up the processing status message."""
+    async def _delete_pending(self, chat_id: int, bot: BotProtocol):
+        await asyncio.sleep(self.delete_batch_seconds)
+        message_ids, _ = self._pending_deletes.pop(chat_id)
         try:
-            await bot.delete_messages(entity=job.chat_id, message_ids=job.processing_msg_id)
+            await bot.delete_messages(entity=chat_id, message_ids=message_ids)
         except Exception:
-            pass  # Message might already be deleted or not exist
+            pass  # Messages might already be deleted or not exist
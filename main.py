@@ -1,24 +1,66 @@
 import os
 import asyncio
 import logging
+from dataclasses import dataclass
+from typing import Mapping, Optional
 
 from telethon import TelegramClient, events
-from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto
+from telethon.tl.types import DocumentAttributeAudio
 from bot_core import BotCore, AudioMessage, Job, Config
 
 try:
-    import whisper
+    import uvloop
 except ImportError:
-    whisper = None
+    uvloop = None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Bot settings read from the environment."""
+    whisper_model: str
+    whisper_backend: str
+    whisper_compute_type: Optional[str]  # Picked from the CPU's features when unset
+    num_workers: int
+    telegram_bot_token: Optional[str]
+    api_id: int
+    api_hash: str
+    max_jobs_per_user_in_queue: int
+    max_batch_size: int
+    transcript_cache_size: int
+    compile_encoder: bool
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "Settings":
+        """Parse the settings from env, falling back to the Config defaults."""
+        return cls(
+            whisper_model=env.get("WHISPER_MODEL", Config.DEFAULT_WHISPER_MODEL),
+            whisper_backend=env.get("WHISPER_BACKEND", Config.DEFAULT_WHISPER_BACKEND),
+            whisper_compute_type=env.get("WHISPER_COMPUTE_TYPE"),
+            num_workers=int(env.get("NUM_WORKERS", str(Config.DEFAULT_NUM_WORKERS))),
+            telegram_bot_token=env.get("TELEGRAM_BOT_TOKEN"),
+            api_id=int(env.get("API_ID", "0")),
+            api_hash=env.get("API_HASH", ""),
+            max_jobs_per_user_in_queue=int(env.get("MAX_JOBS_PER_USER_IN_QUEUE", str(Config.DEFAULT_MAX_JOBS_PER_USER))),
+            max_batch_size=int(env.get("MAX_BATCH_SIZE", str(Config.DEFAULT_MAX_BATCH_SIZE))),
+            transcript_cache_size=int(env.get("TRANSCRIPT_CACHE_SIZE", str(Config.DEFAULT_TRANSCRIPT_CACHE_SIZE))),
+            compile_encoder=env.get("WHISPER_COMPILE_ENCODER", "0") == "1",
+        )
+
 
-WHISPER_MODEL = os.getenv("WHISPER_MODEL", Config.DEFAULT_WHISPER_MODEL)
-NUM_WORKERS = int(os.getenv("NUM_WORKERS", str(Config.DEFAULT_NUM_WORKERS)))
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-API_ID = int(os.getenv("API_ID", "0"))
-API_HASH = os.getenv("API_HASH", "")
+SETTINGS = Settings.from_env()
+WHISPER_MODEL = SETTINGS.whisper_model
+WHISPER_BACKEND = SETTINGS.whisper_backend
+WHISPER_COMPUTE_TYPE = SETTINGS.whisper_compute_type
+NUM_WORKERS = SETTINGS.num_workers
+TELEGRAM_BOT_TOKEN = SETTINGS.telegram_bot_token
+API_ID = SETTINGS.api_id
+API_HASH = SETTINGS.api_hash
 MAX_FILE_SIZE_MB = Config.DEFAULT_MAX_FILE_SIZE
 MAX_QUEUE_SIZE = Config.DEFAULT_MAX_QUEUE_SIZE
-MAX_JOBS_PER_USER_IN_QUEUE = int(os.getenv("MAX_JOBS_PER_USER_IN_QUEUE", str(Config.DEFAULT_MAX_JOBS_PER_USER)))
+MAX_JOBS_PER_USER_IN_QUEUE = SETTINGS.max_jobs_per_user_in_queue
+MAX_BATCH_SIZE = SETTINGS.max_batch_size
+TRANSCRIPT_CACHE_SIZE = SETTINGS.transcript_cache_size
+WHISPER_COMPILE_ENCODER = SETTINGS.compile_encoder
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
@@ -31,49 +73,64 @@ bot_core = BotCore(
     num_workers=NUM_WORKERS,
     max_file_size=MAX_FILE_SIZE_MB,
     max_queue_size=MAX_QUEUE_SIZE,
-    max_jobs_per_user_in_queue=MAX_JOBS_PER_USER_IN_QUEUE
+    max_jobs_per_user_in_queue=MAX_JOBS_PER_USER_IN_QUEUE,
+    backend=WHISPER_BACKEND,
+    compute_type=WHISPER_COMPUTE_TYPE,
+    max_batch_size=MAX_BATCH_SIZE,
+    transcript_cache_size=TRANSCRIPT_CACHE_SIZE,
+    compile_encoder=WHISPER_COMPILE_ENCODER
 )
 
 
 # processing_queue is now managed by bot_core
 
 
+START_TEXT = "Hi! Send me a voice message or audio file (up to 2 GB), and I'll transcribe it for you."
+HELP_TEXT = (
+    "Send me any voice message or audio file, and I'll convert it to text. "
+    f"I can process up to {NUM_WORKERS} files at the same time. If the queue is full, please wait."
+)
+
+
 async def start(event):
     """Send a message when the command /start is issued."""
-    await event.respond(
-        "Hi! Send me a voice message or audio file (up to 2 GB), and I'll transcribe it for you."
-    )
+    await event.respond(START_TEXT)
 
 
 async def help_command(event):
     """Send a message when the command /help is issued."""
-    await event.respond(
-        "Send me any voice message or audio file, and I'll convert it to text. "
-        f"I can process up to {NUM_WORKERS} files at the same time. If the queue is full, please wait."
-    )
+    await event.respond(HELP_TEXT)
+
+
+def is_audio_message(event) -> bool:
+    """Event filter so only voice messages and audio files reach handle_audio."""
+    try:
+        document = event.message.media.document
+        return bool(document) and document.mime_type.startswith('audio/')
+    except AttributeError:
+        return False
 
 
 async def handle_audio(event):
     """Handles incoming audio, adds it to the queue."""
     message = event.message
 
-    # Check if message has media (voice or audio)
-    if not message.media:
-        return
-        
-    # Handle voice messages and audio files
-    if hasattr(message.media, 'document') and message.media.document:
-        document = message.media.document
-        # Check if it's audio/voice by mime_type
-        if not document.mime_type.startswith('audio/'):
-            return
-        
-        file_size = document.size
-        file_name = getattr(document, 'file_name', None) or f"audio_{document.id}.{document.mime_type.split('/')[1]}"
-        mime_type = document.mime_type
-        file_id = document.id
-    else:
+    # Voice messages and audio files arrive as documents with an audio/* mime type
+    if not is_audio_message(event):
         return
+    document = message.media.document
+    mime_type = document.mime_type
+
+    file_size = document.size
+    file_name = getattr(document, 'file_name', None) or f"audio_{document.id}.{mime_type.split('/')[1]}"
+    file_id = document.id
+    # Duration is in the document metadata, so junk clips can be rejected before downloading.
+    # Some clients send 0 when they didn't measure it, so that counts as unknown.
+    duration = next(
+        (attr.duration for attr in getattr(document, 'attributes', None) or []
+         if isinstance(attr, DocumentAttributeAudio)),
+        None,
+    ) or None
 
     # Create audio message object
     audio_message = AudioMessage(
@@ -81,19 +138,27 @@ async def handle_audio(event):
         file_size=file_size,
         mime_type=mime_type,
         file_name=file_name,
-        file_unique_id=str(file_id)
+        file_unique_id=str(file_id),
+        duration=duration
     )
 
-    # Validate file size
+    # Validate file size and duration
     error_msg = bot_core.validate_audio_file(audio_message)
     if error_msg:
         await event.respond(error_msg)
         return
 
-    # Give immediate feedback that the file is being queued
-    processing_msg = await event.respond("Queueing your audio file...")
+    # Check queue capacity and the user's limit up front, so the reply can carry the
+    # queue position right away instead of being sent and then edited
+    error_msg = bot_core.check_admission(event.chat_id)
+    if error_msg:
+        await event.respond(error_msg)
+        return
+
+    queue_position = bot_core.get_queue_position(file_size) + 1
+    processing_msg = await event.respond(f"Your file has been queued for processing. Position: {queue_position}")
 
-    # Try to queue the job with rate limiting
+    # Queue the job with rate limiting
     success, error_message = await bot_core.queue_audio_job(
         chat_id=event.chat_id,
         message_id=message.id,
@@ -102,52 +167,49 @@ async def handle_audio(event):
     )
 
     if not success:
+        # The queue or the user's limit filled up while the reply was being sent
         await event.client.edit_message(
             entity=event.chat_id,
             message=processing_msg.id,
             text=error_message
         )
-        return
-
-    # Update message with queue position
-    queue_position = bot_core.get_queue_position()
-    await event.client.edit_message(
-        entity=event.chat_id,
-        message=processing_msg.id,
-        text=f"Your file has been queued for processing. Position: {queue_position}"
-    )
 
 
 
 async def worker(name: str, client: TelegramClient):
     """The worker function that processes jobs from the queue."""
-    # Get model for this worker
-    model = bot_core.get_worker_model(name)
+    # Get model for this worker. Loading can take minutes, so keep it off the event
+    # loop and let Telethon keep serving updates meanwhile.
+    model = await asyncio.to_thread(bot_core.get_worker_model, name)
     if not model:
-        logger.error(f"Failed to load model for {name}")
+        logger.error("Failed to load model for %s", name)
         return
     
     while True:
-        job = None
+        jobs = []
         try:
-            job = await bot_core.processing_queue.get()
-            logger.info(f"Worker '{name}' picked up job for chat {job.chat_id}")
-
-            # Process the job using bot_core
-            success = await bot_core.process_audio_job(job, client, model)
-            logger.info(f"Worker '{name}' {'completed' if success else 'failed'} job for chat {job.chat_id}")
+            jobs = await bot_core.next_batch()
+            # The chat id list is built only when it will actually be logged
+            log_info = logger.isEnabledFor(logging.INFO)
+            if log_info:
+                logger.info("Worker '%s' picked up %s job(s) for chats %s", name, len(jobs), [job.chat_id for job in jobs])
+
+            # Process the jobs as one batch using bot_core
+            results = await bot_core.process_batch(jobs, client, model)
+            if log_info:
+                for job, success in zip(jobs, results):
+                    logger.info("Worker '%s' %s job for chat %s", name, 'completed' if success else 'failed', job.chat_id)
 
         except Exception as e:
-            logger.error(f"Worker '{name}' encountered error: {e}", exc_info=True)
-            if job:
+            logger.error("Worker '%s' encountered error: %s", name, e, exc_info=True)
+            for job in jobs:
                 await bot_core.complete_job(job)
 
         finally:
-            if job:
-                try:
-                    await bot_core.cleanup_processing_message(job, client)
-                except Exception:
-                    pass
+            # Deletions run in the background, grouped into one request per chat,
+            # so the worker goes straight back to the queue
+            for job in jobs:
+                bot_core.cleanup_processing_message(job, client)
                 bot_core.processing_queue.task_done()
 
 
@@ -155,7 +217,7 @@ async def start_workers(client: TelegramClient):
     """Create worker tasks after the client is initialized."""
     for i in range(NUM_WORKERS):
         asyncio.create_task(worker(f"Worker-{i + 1}", client))
-    logger.info(f"Started {NUM_WORKERS} worker tasks.")
+    logger.info("Started %s worker tasks.", NUM_WORKERS)
 
 
 async def main():
@@ -181,15 +243,18 @@ async def main():
     async def help_handler(event):
         await help_command(event)
     
-    @client.on(events.NewMessage)
+    # Filtered at dispatch, so text messages and other media never reach the handler
+    @client.on(events.NewMessage(func=is_audio_message))
     async def audio_handler(event):
-        # Only handle messages with media (audio/voice)
-        if event.message.media:
-            await handle_audio(event)
+        await handle_audio(event)
     
     logger.info("Bot is starting... Press Ctrl+C to stop.")
     await client.run_until_disconnected()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        # Faster event loop for Telethon's network I/O and the job queue
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -5,6 +5,9 @@ pkgs.mkShell {
     ffmpeg
     (python313.withPackages (ps: with ps; [
       telethon
+      faster-whisper
+      numpy
+      uvloop
       openai-whisper
     ]))
   ];
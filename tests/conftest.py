@@ -1,18 +1,23 @@
 import pytest
-from unittest.mock import AsyncMock, MagicMock
+import numpy as np
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 from bot_core import AudioMessage, BotCore, Job
 
 
+@pytest.fixture(autouse=True)
+def clear_model_cache():
+    """Keep the process-wide model cache from leaking mocks between tests."""
+    BotCore._MODEL_CACHE.clear()
+    yield
+    BotCore._MODEL_CACHE.clear()
+
+
 @pytest.fixture
 def mock_bot():
     """Mock Bot object for testing."""
     bot = AsyncMock()
     
-    # Mock file object with download_to_drive method
-    mock_file = AsyncMock()
-    mock_file.download_to_drive = AsyncMock()
-    bot.get_file.return_value = mock_file
-    
     # Mock message responses
     mock_message = MagicMock()
     mock_message.message_id = 123
@@ -20,6 +25,9 @@ def mock_bot():
     bot.edit_message.return_value = mock_message
     bot.delete_message.return_value = None
     
+    # iter_download is a plain method returning an async iterator
+    bot.iter_download = MagicMock()
+    
     return bot
 
 
@@ -38,10 +46,46 @@ def bot_core():
         whisper_model="base",
         num_workers=2,
         max_file_size=20 * 1024 * 1024,
-        max_queue_size=100
+        max_queue_size=100,
+        backend="openai"
+    )
+
+
+@pytest.fixture(scope="module")
+def bot_core_ro():
+    """Module-wide BotCore for tests that only read it (validation, error messages).
+
+    Tests that queue jobs, process audio or otherwise change state use bot_core.
+    """
+    return BotCore(
+        whisper_model="base",
+        num_workers=2,
+        max_file_size=20 * 1024 * 1024,
+        max_queue_size=100,
+        backend="openai"
     )
 
 
+@pytest.fixture(scope="module")
+def bot_core_2gb():
+    """Module-wide BotCore with the default 2 GB file size limit, for read-only size checks."""
+    return BotCore(max_file_size=2 * 1024 * 1024 * 1024)
+
+
+@pytest.fixture
+def pipeline():
+    """Patch decode_audio and BotCore._transcribe: 1 s of decoded audio and a fixed transcription.
+
+    Tests override return_value or side_effect on pipeline.decode / pipeline.transcribe.
+    pipeline.model is a plain placeholder to pass as the model, since the patched
+    _transcribe never touches it.
+    """
+    with patch('bot_core.decode_audio') as decode, patch('bot_core.BotCore._transcribe') as transcribe:
+        decode.return_value = np.zeros(16000, dtype=np.float32)
+        transcribe.return_value = "Test transcription"
+        yield SimpleNamespace(decode=decode, transcribe=transcribe, model=object())
+
+
 @pytest.fixture
 def sample_audio():
     """Sample audio message for testing."""
@@ -54,10 +98,10 @@ def sample_audio():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_jobs():
-    """Sample jobs for concurrency testing."""
-    return [
+    """Sample jobs for concurrency testing (Job is frozen, so one tuple serves every test)."""
+    return tuple(
         Job(
             chat_id=12345 + i,
             message_id=i,
@@ -68,7 +112,7 @@ def sample_jobs():
             processing_msg_id=i + 100
         )
         for i in range(5)
-    ]
+    )
 
 
 @pytest.fixture
@@ -113,24 +157,10 @@ def multiple_users():
     return [12345, 67890, 11111, 22222, 33333]
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_job():
-    """Standard test job for validation and error testing."""
+    """Standard test job for validation and error testing (frozen, so shared by every test)."""
     return Job(
         chat_id=12345, message_id=1, file_id="test_file_123", file_name="test_audio.ogg",
         mime_type="audio/ogg", file_size=1024 * 1024, processing_msg_id=2
     )
-
-
-@pytest.fixture
-def mock_whisper_setup():
-    """Standard whisper mock setup for most tests."""
-    def _setup(bot_core, mock_tempdir, mock_whisper, audio_data=None, transcription="Test transcription"):
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        if audio_data is not None:
-            mock_whisper.load_audio.return_value = audio_data
-        else:
-            mock_whisper.load_audio.return_value = [0] * 16000  # 1 second default
-        return {"text": transcription}
-    return _setup
\ No newline at end of file
@@ -1,39 +1,38 @@
+import os
 import pytest
 import asyncio
-import mimetypes
+import tempfile
+from dataclasses import replace
 from unittest.mock import AsyncMock, MagicMock, patch
-from bot_core import BotCore, Job, AudioMessage
+from bot_core import (BotCore, Config, Job, AudioMessage, NON_STREAMABLE_MIME_TYPES, DOWNLOAD_CHUNK_SIZE, MIME_EXTENSIONS,
+                      iter_download_parallel)
 
 pytestmark = pytest.mark.asyncio
 
+# Common audio formats: (mime type, file name, expected extension)
+SAMPLE_FORMATS = [
+    ("audio/ogg", "voice.ogg", ".ogg"),
+    ("audio/mpeg", "song.mp3", ".mp3"),
+    ("audio/mp4", "audio.m4a", ".m4a"),
+    ("audio/wav", "sound.wav", ".wav"),
+    ("audio/x-wav", "sound.wav", ".wav"),
+    ("audio/flac", "music.flac", ".flac"),
+    ("audio/aac", "audio.aac", ".aac"),
+    ("audio/webm", "voice.webm", ".webm"),
+    ("audio/x-m4a", "audio.m4a", ".m4a"),
+]
 
-class TestAudioFormats:
-    """Test handling of various audio formats and MIME types."""
+# Less common or edge case formats
+UNCOMMON_FORMATS = [
+    ("audio/amr", "voice.amr", ".amr"),
+    ("audio/3gpp", "voice.3gp", ".3gp"),
+    ("audio/x-ms-wma", "song.wma", ".wma"),
+    ("audio/opus", "voice.opus", ".opus"),
+]
 
-    @pytest.fixture
-    def sample_formats(self):
-        """Common audio formats to test."""
-        return [
-            ("audio/ogg", "voice.ogg", ".ogg"),
-            ("audio/mpeg", "song.mp3", ".mp3"),
-            ("audio/mp4", "audio.m4a", ".m4a"),
-            ("audio/wav", "sound.wav", ".wav"),
-            ("audio/x-wav", "sound.wav", ".wav"),
-            ("audio/flac", "music.flac", ".flac"),
-            ("audio/aac", "audio.aac", ".aac"),
-            ("audio/webm", "voice.webm", ".webm"),
-            ("audio/x-m4a", "audio.m4a", ".m4a"),
-        ]
 
-    @pytest.fixture
-    def uncommon_formats(self):
-        """Less common or edge case formats."""
-        return [
-            ("audio/amr", "voice.amr", ".amr"),
-            ("audio/3gpp", "voice.3gp", ".3gp"),
-            ("audio/x-ms-wma", "song.wma", ".wma"),
-            ("audio/opus", "voice.opus", ".opus"),
-        ]
+class TestAudioFormats:
+    """Test handling of various audio formats and MIME types."""
 
     def create_audio_message(self, mime_type, filename, file_size=1024*1024):
         """Helper to create AudioMessage with specific format."""
@@ -57,206 +56,221 @@ class TestAudioFormats:
             processing_msg_id=2
         )
 
-    async def test_validate_common_audio_formats(self, bot_core, sample_formats):
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", SAMPLE_FORMATS)
+    async def test_validate_common_audio_formats(self, bot_core_ro, mime_type, filename, expected_ext):
         """Test that common audio formats are accepted."""
-        for mime_type, filename, _ in sample_formats:
-            audio = self.create_audio_message(mime_type, filename)
-            error = bot_core.validate_audio_file(audio)
-            assert error is None, f"Format {mime_type} should be valid"
+        audio = self.create_audio_message(mime_type, filename)
+        assert bot_core_ro.validate_audio_file(audio) is None
 
-    async def test_queue_audio_with_various_formats(self, bot_core, sample_formats):
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", SAMPLE_FORMATS)
+    async def test_queue_audio_with_various_formats(self, bot_core, mime_type, filename, expected_ext):
         """Test queueing audio with different formats."""
-        for i, (mime_type, filename, _) in enumerate(sample_formats):
-            audio = self.create_audio_message(mime_type, filename)
-            # Use different chat_id for each format to avoid rate limiting
-            success, error = await bot_core.queue_audio_job(12345 + i, 1, audio, 2)
-            assert success is True, f"Should queue {mime_type} successfully, got error: {error}"
+        audio = self.create_audio_message(mime_type, filename)
+        success, error = await bot_core.queue_audio_job(12345, 1, audio, 2)
+        assert success is True, f"Should queue {mime_type} successfully, got error: {error}"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    @patch('mimetypes.guess_extension')
-    async def test_file_extension_mapping(self, mock_guess_ext, mock_tempdir, mock_to_thread, 
-                                        mock_whisper, bot_core, mock_bot, sample_formats):
-        """Test that MIME types map to correct file extensions."""
-        for mime_type, filename, expected_ext in sample_formats:
-            # Setup mocks
-            bot_core.model = MagicMock()
-            mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-            mock_whisper.load_audio.return_value = [0] * 16000
-            mock_to_thread.return_value = {"text": "Test transcription"}
-            mock_guess_ext.return_value = expected_ext
-            
-            job = self.create_job_for_format(mime_type, filename)
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", SAMPLE_FORMATS)
+    async def test_file_extension_mapping(self, bot_core, mock_bot, mime_type, filename, expected_ext, pipeline):
+        """Test that MP4-family formats are saved with the right extension and others stream."""
+        job = self.create_job_for_format(mime_type, filename)
+        # Without faster-whisper's PyAV, MP4-family files go through a temp file
+        with patch('bot_core.faster_whisper', None):
             result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        assert result is True
+        if mime_type in NON_STREAMABLE_MIME_TYPES:
+            assert pipeline.decode.call_args[0][0].endswith(expected_ext)
+        else:
+            pipeline.decode.assert_called_once_with(mock_bot.iter_download.return_value, None)
+
+    async def test_temp_download_uses_tmpfs(self, bot_core, mock_bot, tmp_path, pipeline):
+        """Test that MP4-family downloads land on tmpfs when it has room, and on disk otherwise."""
+        with patch('bot_core.SHM_DIR', str(tmp_path)), patch('bot_core.faster_whisper', None):
+            await bot_core.process_audio_job(self.create_job_for_format("audio/mp4", "a.m4a"), mock_bot, MagicMock())
+            assert os.path.dirname(pipeline.decode.call_args[0][0]) == str(tmp_path)
             
-            assert result is True
-            # Verify mimetypes.guess_extension was called with the MIME type
-            mock_guess_ext.assert_called_with(mime_type)
+            with patch('bot_core.shutil.disk_usage') as mock_usage:
+                mock_usage.return_value.free = 0
+                await bot_core.process_audio_job(self.create_job_for_format("audio/mp4", "a.m4a"), mock_bot, MagicMock())
+            assert os.path.dirname(pipeline.decode.call_args[0][0]) == tempfile.gettempdir()
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    @patch('mimetypes.guess_extension')
-    async def test_unknown_mime_type_fallback(self, mock_guess_ext, mock_tempdir, mock_to_thread,
-                                            mock_whisper, bot_core, mock_bot):
-        """Test handling of unknown MIME types."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": "Test transcription"}
-        mock_guess_ext.return_value = None  # Unknown MIME type
+    async def test_mp4_decoded_in_memory_with_pyav(self, bot_core, mock_bot, pipeline):
+        """Test that MP4-family files are decoded in-process from memory when faster-whisper is installed."""
+        message = mock_bot.get_messages.return_value
+        message.download_media.return_value = b"mp4 bytes"
+        
+        with patch('bot_core.faster_whisper') as mock_faster_whisper:
+            mock_faster_whisper.decode_audio.return_value = [0] * 16000
+            result = await bot_core.process_audio_job(self.create_job_for_format("audio/mp4", "a.m4a"), mock_bot, MagicMock())
+        
+        assert result is True
+        message.download_media.assert_called_once_with(bytes)
+        source = mock_faster_whisper.decode_audio.call_args[0][0]
+        assert source.getvalue() == b"mp4 bytes"
+        pipeline.decode.assert_not_called()
+
+    async def test_large_mp4_decoded_from_temp_file(self, bot_core, mock_bot, pipeline):
+        """Test that MP4-family files too large to hold in memory go through a temp file even with PyAV."""
+        bot_core.max_file_size = 2 * 1024 * 1024 * 1024
+        job = replace(self.create_job_for_format("audio/mp4", "a.m4a"), file_size=Config.MAX_IN_MEMORY_DECODE_SIZE + 1)
+        message = mock_bot.get_messages.return_value
+        
+        with patch('bot_core.faster_whisper') as mock_faster_whisper:
+            result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        assert result is True
+        mock_faster_whisper.decode_audio.assert_not_called()
+        assert message.download_media.call_args[0][0].endswith(".m4a")
+        assert pipeline.decode.call_args[0][0].endswith(".m4a")
+
+    async def test_extension_table_matches_known_formats(self):
+        """Test that the static extension table agrees with the formats we expect."""
+        for mime_type, _, expected_ext in SAMPLE_FORMATS + UNCOMMON_FORMATS:
+            if mime_type in MIME_EXTENSIONS:
+                assert MIME_EXTENSIONS[mime_type] == expected_ext
+        assert NON_STREAMABLE_MIME_TYPES <= MIME_EXTENSIONS.keys()
+
+    async def test_unknown_mime_type_streamed(self, bot_core, mock_bot, pipeline):
+        """Test that unknown MIME types are streamed and left to ffmpeg to probe."""
         
         job = self.create_job_for_format("audio/unknown", "mystery.xyz")
         result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
         
         assert result is True
-        # Should fall back to .ogg extension
-        mock_guess_ext.assert_called_with("audio/unknown")
+        pipeline.decode.assert_called_once_with(mock_bot.iter_download.return_value, None)
 
-    async def test_filename_generation_for_different_formats(self, bot_core, sample_formats):
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", SAMPLE_FORMATS)
+    async def test_filename_generation_for_different_formats(self, bot_core, mime_type, filename, expected_ext):
         """Test filename generation for various formats."""
-        for i, (mime_type, _, expected_ext) in enumerate(sample_formats):
-            # Test with no filename provided
-            audio = AudioMessage(
-                file_id=f"test_{i}",
-                file_size=1024*1024,
-                mime_type=mime_type,
-                file_name=None,
-                file_unique_id=f"unique_{i}"
-            )
-            
-            # Use different chat_id for each format to avoid rate limiting
-            success, _ = await bot_core.queue_audio_job(12345 + i, 1, audio, 2)
-            assert success is True
-            
-            # Get the job from the queue to check filename
-            job = await bot_core.processing_queue.get()
-            
-            if mime_type == "audio/ogg":
-                assert job.file_name == "voice_message.ogg"
-            else:
-                expected_filename = f"audio_file_unique_{i}.{mime_type.split('/')[1]}"
-                assert job.file_name == expected_filename
+        # Test with no filename provided
+        audio = AudioMessage(
+            file_id="test_file",
+            file_size=1024*1024,
+            mime_type=mime_type,
+            file_name=None,
+            file_unique_id="unique_file"
+        )
+        
+        success, _ = await bot_core.queue_audio_job(12345, 1, audio, 2)
+        assert success is True
+        
+        job = bot_core._peek_last_queued()
+        
+        if mime_type == "audio/ogg":
+            assert job.file_name == "voice_message.ogg"
+        else:
+            assert job.file_name == f"audio_file_unique_file.{mime_type.split('/')[1]}"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_format_specific_processing(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                            bot_core, mock_bot, uncommon_formats):
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", UNCOMMON_FORMATS)
+    async def test_format_specific_processing(self, bot_core, mock_bot, mime_type, filename, expected_ext, pipeline):
         """Test processing of less common audio formats."""
-        for mime_type, filename, _ in uncommon_formats:
-            # Setup mocks
-            bot_core.model = MagicMock()
-            mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-            mock_whisper.load_audio.return_value = [0] * 16000  # 1 second
-            mock_to_thread.return_value = {"text": f"Transcription for {mime_type}"}
-            
-            job = self.create_job_for_format(mime_type, filename)
+        pipeline.transcribe.return_value = f"Transcription for {mime_type}"
+        
+        job = self.create_job_for_format(mime_type, filename)
+        with patch('bot_core.faster_whisper', None):
             result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
-            
-            assert result is True
-            
-            # Verify transcription was sent
-            mock_bot.send_message.assert_called()
-            send_call = mock_bot.send_message.call_args
-            assert f"Transcription for {mime_type}" in send_call[1]['message']
-            
-            # Reset mock for next iteration
-            mock_bot.reset_mock()
+        
+        assert result is True
+        
+        # Verify transcription was sent
+        mock_bot.send_message.assert_called()
+        send_call = mock_bot.send_message.call_args
+        assert f"Transcription for {mime_type}" in send_call[1]['message']
 
-    async def test_format_validation_edge_cases(self, bot_core):
+    @pytest.mark.parametrize("mime_type,filename", [
+        ("audio/ogg", "voice.ogg"),
+        ("audio/mpeg", "song.mp3"),
+        ("AUDIO/WAV", "sound.wav"),  # Case insensitive
+        # Still accepted: validation is size-based, not format-based
+        ("text/plain", "document.txt"),
+        ("application/octet-stream", "binary.bin"),
+    ])
+    async def test_format_validation_edge_cases(self, bot_core_ro, mime_type, filename):
         """Test edge cases in format validation."""
-        test_cases = [
-            # Valid cases
-            ("audio/ogg", "voice.ogg", True),
-            ("audio/mpeg", "song.mp3", True),
-            ("AUDIO/WAV", "sound.wav", True),  # Case insensitive
-            
-            # Invalid cases (still accepted - validation is size-based, not format-based)
-            ("text/plain", "document.txt", True),  # Wrong type, but size is OK
-            ("application/octet-stream", "binary.bin", True),  # Generic binary
-        ]
+        audio = self.create_audio_message(mime_type, filename)
+        assert bot_core_ro.validate_audio_file(audio) is None, f"{mime_type} should be accepted"
+
+    @pytest.mark.parametrize("mime_type,filename", [
+        ("audio/wav", "test.wav"),
+        ("audio/mp3", "test.mp3"),
+        ("audio/flac", "test.flac"),
+    ])
+    async def test_download_streamed_into_decoder(self, bot_core, mock_bot, mime_type, filename, pipeline):
+        """Test that streamable formats are fed to ffmpeg straight from the download."""
+        message = mock_bot.get_messages.return_value
         
-        for mime_type, filename, should_be_valid in test_cases:
-            audio = self.create_audio_message(mime_type, filename)
-            error = bot_core.validate_audio_file(audio)
-            
-            if should_be_valid:
-                assert error is None, f"{mime_type} should be accepted"
-            else:
-                assert error is not None, f"{mime_type} should be rejected"
+        job = self.create_job_for_format(mime_type, filename)
+        await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        # Verify the download iterator went to the decoder without touching disk
+        mock_bot.iter_download.assert_called_with(message.media, request_size=DOWNLOAD_CHUNK_SIZE)
+        pipeline.decode.assert_called_once_with(mock_bot.iter_download.return_value, None)
+        message.download_media.assert_not_called()
 
-    @patch('bot_core.whisper')
-    async def test_whisper_load_audio_called_correctly(self, mock_whisper, bot_core, mock_bot):
-        """Test that whisper.load_audio is called with correct file path."""
-        formats_to_test = [
-            ("audio/wav", "test.wav"),
-            ("audio/mp3", "test.mp3"),
-            ("audio/flac", "test.flac"),
-        ]
+    async def test_parallel_download_keeps_byte_order(self):
+        """Test that ranged downloads run concurrently but reach the decoder in file order."""
+        segment_size = DOWNLOAD_CHUNK_SIZE * Config.DOWNLOAD_SEGMENT_CHUNKS
+        file_size = segment_size * 6 + 100
+        in_flight = 0
+        peak = 0
         
-        for mime_type, filename in formats_to_test:
-            with patch('tempfile.TemporaryDirectory') as mock_tempdir, \
-                 patch('bot_core.asyncio.to_thread') as mock_to_thread:
-                
-                # Setup mocks
-                bot_core.model = MagicMock()
-                mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-                mock_whisper.load_audio.return_value = [0] * 16000
-                mock_to_thread.return_value = {"text": "Test"}
-                
-                job = self.create_job_for_format(mime_type, filename)
-                await bot_core.process_audio_job(job, mock_bot, MagicMock())
-                
-                # Verify whisper.load_audio was called with the temp path
-                mock_whisper.load_audio.assert_called()
-                called_path = mock_whisper.load_audio.call_args[0][0]
-                assert called_path.startswith("/tmp/test/audio")
-                
-                # Reset mocks for next iteration
-                mock_whisper.reset_mock()
+        async def iter_download(media, offset, limit, request_size):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            # Later segments finish first, so order must come from the downloader
+            await asyncio.sleep(0.001 * (file_size - offset) / segment_size)
+            in_flight -= 1
+            end = min(offset + limit * request_size, file_size)
+            for start in range(offset, end, request_size):
+                yield f"{start}-{min(start + request_size, end)};".encode()
+        
+        bot = MagicMock()
+        bot.iter_download = iter_download
+        
+        data = b"".join([chunk async for chunk in iter_download_parallel(bot, "media", file_size)])
+        
+        ranges = [tuple(map(int, part.split("-"))) for part in data.decode().rstrip(";").split(";")]
+        assert ranges[0][0] == 0 and ranges[-1][1] == file_size
+        assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+        assert peak == Config.PARALLEL_DOWNLOADS
 
-    async def test_large_files_different_formats(self, bot_core, sample_formats):
+    async def test_large_file_downloaded_in_parallel(self, bot_core, mock_bot, pipeline):
+        """Test that only files larger than one download segment use ranged downloads."""
+        job = replace(self.create_job_for_format("audio/ogg", "long.ogg"), file_size=16 * 1024 * 1024)
+        
+        with patch('bot_core.iter_download_parallel') as mock_parallel:
+            await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        message = mock_bot.get_messages.return_value
+        mock_parallel.assert_called_once_with(mock_bot, message.media, job.file_size)
+        assert pipeline.decode.call_args[0][0] is mock_parallel.return_value
+
+    @pytest.mark.parametrize("mime_type,filename,expected_ext", SAMPLE_FORMATS)
+    async def test_large_files_different_formats(self, bot_core_ro, mime_type, filename, expected_ext):
         """Test that large file validation works across formats."""
-        for mime_type, filename, _ in sample_formats:
-            # Create oversized file
-            audio = self.create_audio_message(mime_type, filename, 25 * 1024 * 1024)
-            error = bot_core.validate_audio_file(audio)
-            assert error is not None, f"Large {mime_type} file should be rejected"
-            assert "too large" in error.lower()
+        audio = self.create_audio_message(mime_type, filename, 25 * 1024 * 1024)
+        error = bot_core_ro.validate_audio_file(audio)
+        assert error is not None, f"Large {mime_type} file should be rejected"
+        assert "too large" in error.lower()
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_format_specific_error_handling(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                 bot_core, mock_bot):
+    @pytest.mark.parametrize("mime_type,filename", [
+        ("audio/corrupted", "bad.ogg"),
+        ("audio/invalid", "invalid.mp3"),
+    ])
+    async def test_format_specific_error_handling(self, bot_core, mock_bot, mime_type, filename, pipeline):
         """Test error handling for different formats."""
-        error_formats = [
-            ("audio/corrupted", "bad.ogg"),
-            ("audio/invalid", "invalid.mp3"),
-        ]
+        pipeline.decode.side_effect = Exception(f"Cannot process {mime_type}")
         
-        for mime_type, filename in error_formats:
-            # Setup mocks to simulate processing error
-            bot_core.model = MagicMock()
-            mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-            mock_whisper.load_audio.side_effect = Exception(f"Cannot process {mime_type}")
-            
-            job = self.create_job_for_format(mime_type, filename)
-            result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
-            
-            assert result is False
-            mock_bot.send_message.assert_called_with(
-                entity=job.chat_id,
-                message="Sorry, an error occurred while processing your file.",
-                reply_to=job.message_id
-            )
-            
-            # Reset mocks
-            mock_bot.reset_mock()
-            mock_whisper.reset_mock()
+        job = self.create_job_for_format(mime_type, filename)
+        result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        assert result is False
+        mock_bot.send_message.assert_called_once_with(
+            entity=job.chat_id,
+            message="Sorry, an error occurred while processing your file.",
+            reply_to=job.message_id
+        )
 
     async def test_voice_message_mime_type_handling(self, bot_core):
         """Test specific handling of Telegram voice message format."""
@@ -273,6 +287,6 @@ class TestAudioFormats:
         assert success is True
         
         # Check generated filename
-        job = await bot_core.processing_queue.get()
+        job = bot_core._peek_last_queued()
         assert job.file_name == "voice_message.ogg"
         assert job.mime_type == "audio/ogg"
\ No newline at end of file
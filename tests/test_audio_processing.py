@@ -1,10 +1,19 @@
+import os
+import sys
 import pytest
 import asyncio
+import numpy as np
 from unittest.mock import AsyncMock, MagicMock, patch, mock_open
-from bot_core import BotCore, Job, AudioMessage
+from bot_core import BotCore, Config, Job, AudioMessage, StatusPinger, decode_audio
 
 pytestmark = pytest.mark.asyncio
 
+# Decoded audio is float32 samples at 16 kHz; built once and shared, since nothing writes to them
+_AUDIO_1S = np.zeros(16000, dtype=np.float32)
+_AUDIO_5S = np.zeros(16000 * 5, dtype=np.float32)
+_AUDIO_90S = np.zeros(16000 * 90, dtype=np.float32)
+_AUDIO_2MIN = np.zeros(16000 * 120, dtype=np.float32)
+
 
 class TestAudioProcessing:
     """Test audio processing workflow."""
@@ -37,7 +46,6 @@ class TestAudioProcessing:
 
     async def test_process_oversized_file_rejected(self, bot_core, mock_bot, large_job):
         """Test that oversized files are rejected during processing."""
-        bot_core.model = MagicMock()  # Mock model
         
         result = await bot_core.process_audio_job(large_job, mock_bot, MagicMock())
         
@@ -48,24 +56,16 @@ class TestAudioProcessing:
             text="File is too large. The limit is 2 GB."
         )
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_successful_audio_processing(self, mock_tempdir, mock_to_thread, mock_whisper, 
-                                             bot_core, mock_bot, sample_job):
+    async def test_successful_audio_processing(self, bot_core, mock_bot, sample_job, pipeline):
         """Test successful audio processing workflow."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000  # 1 second of audio
-        mock_to_thread.return_value = {"text": "Hello world test transcription"}
+        pipeline.transcribe.return_value = "Hello world test transcription"
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
         assert result is True
         
         # Verify bot interactions
-        assert mock_bot.edit_message.call_count >= 3  # Download, analyze, process messages
+        mock_bot.edit_message.assert_not_called()  # Status edits are debounced away for fast jobs
         mock_bot.send_message.assert_called_once()
         
         # Verify transcription was sent
@@ -74,17 +74,53 @@ class TestAudioProcessing:
         assert "Transcription:" in send_call[1]['message']
         assert "Hello world test transcription" in send_call[1]['message']
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_empty_transcription(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                     bot_core, mock_bot, sample_job):
+    async def test_decoded_audio_reused_for_transcription(self, bot_core, mock_bot, sample_job, pipeline):
+        """Test that the audio is decoded once and the samples are passed to the model."""
+        model = MagicMock()
+        audio = _AUDIO_1S
+        pipeline.decode.return_value = audio
+        
+        result = await bot_core.process_audio_job(sample_job, mock_bot, model)
+        
+        assert result is True
+        pipeline.decode.assert_called_once()
+        pipeline.transcribe.assert_called_once_with(model, audio)
+
+    async def test_decode_buffer_reused_by_next_job(self, bot_core, mock_bot, sample_job, pipeline):
+        """Test that a finished job's sample buffer is handed to the next decode."""
+        buffer = np.zeros(16000 * 2, dtype=np.float32)
+        pipeline.decode.return_value = buffer[:16000]
+        
+        await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
+        await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
+        
+        assert pipeline.decode.call_args_list[0][0][1] is None
+        assert pipeline.decode.call_args_list[1][0][1] is buffer
+
+    async def test_decode_buffers_kept_within_byte_cap(self, bot_core):
+        """Test that finished buffers are dropped once the pool would exceed its byte cap."""
+        size = 16000 * 60
+        buffers = [np.zeros(size, dtype=np.float32) for _ in range(3)]
+        
+        with patch.object(Config, 'MAX_REUSED_DECODE_BYTES', 2 * size * 4):
+            for buffer in buffers:
+                bot_core._release_decode_buffer(buffer[:16000])
+        
+        assert [id(kept) for kept in bot_core._decode_buffers] == [id(buffer) for buffer in buffers[:2]]
+
+    async def test_transcription_runs_on_dedicated_pool(self, bot_core):
+        """Test that transcription runs on the whisper thread pool, not the default executor."""
+        import threading
+        model = MagicMock()
+        model.transcribe.side_effect = lambda audio, **kwargs: {"text": threading.current_thread().name}
+        
+        thread_name = await bot_core._transcribe(model, _AUDIO_1S)
+        
+        assert thread_name.startswith("whisper")
+
+    async def test_empty_transcription(self, bot_core, mock_bot, sample_job, pipeline):
         """Test handling of audio with no detectable speech."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": "   "}  # Empty/whitespace transcription
+        pipeline.transcribe.return_value = "   "  # Empty/whitespace transcription
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
@@ -95,20 +131,12 @@ class TestAudioProcessing:
             reply_to=sample_job.message_id
         )
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')  
-    @patch('tempfile.TemporaryDirectory')
-    async def test_long_transcription_chunked(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                            bot_core, mock_bot, sample_job):
+    async def test_long_transcription_chunked(self, bot_core, mock_bot, sample_job, pipeline):
         """Test that long transcriptions are properly chunked."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
         
         # Create a very long transcription that will need chunking
         long_text = "This is a test. " * 300  # Should exceed 4096 chars
-        mock_to_thread.return_value = {"text": long_text}
+        pipeline.transcribe.return_value = long_text
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
@@ -117,16 +145,37 @@ class TestAudioProcessing:
         # Should have multiple send_message calls for chunks
         assert mock_bot.send_message.call_count > 1
         
-        # Verify all chunks contain header and content
+        # Verify all chunks contain header and content, numbered so the reader can order them
+        total = mock_bot.send_message.call_count
+        prefixes = set()
         for call in mock_bot.send_message.call_args_list:
-            assert "Transcription:" in call[1]['message']
+            message = call[1]['message']
+            assert "Transcription:" in message
+            assert len(message) <= 4096
+            prefixes.add(message.split(" ", 1)[0])
+        assert prefixes == {f"[{i}/{total}]" for i in range(1, total + 1)}
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    async def test_processing_download_error(self, mock_to_thread, mock_whisper, bot_core, mock_bot, sample_job):
+    async def test_chunks_sent_concurrently(self, bot_core, mock_bot, sample_job):
+        """Test that chunk sends overlap instead of waiting on each other."""
+        in_flight = 0
+        peak = 0
+        
+        async def slow_send(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+        mock_bot.send_message.side_effect = slow_send
+        
+        await bot_core._send_transcription_result(sample_job, mock_bot, "word " * 10000)
+        
+        assert mock_bot.send_message.call_count == 13
+        assert peak == Config.MAX_CONCURRENT_SENDS
+
+    async def test_processing_download_error(self, bot_core, mock_bot, sample_job, pipeline):
         """Test handling of download errors."""
-        bot_core.model = MagicMock()
-        mock_whisper.load_audio.side_effect = Exception("Download failed")
+        pipeline.decode.side_effect = Exception("Download failed")
         mock_bot.get_messages.side_effect = Exception("Download failed")
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
@@ -138,17 +187,9 @@ class TestAudioProcessing:
             reply_to=sample_job.message_id
         )
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_processing_transcription_error(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                bot_core, mock_bot, sample_job):
+    async def test_processing_transcription_error(self, bot_core, mock_bot, sample_job, pipeline):
         """Test handling of transcription errors."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.side_effect = Exception("Whisper transcription failed")
+        pipeline.transcribe.side_effect = Exception("Whisper transcription failed")
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
@@ -159,16 +200,9 @@ class TestAudioProcessing:
             reply_to=sample_job.message_id
         )
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_processing_generic_error(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                          bot_core, mock_bot, sample_job):
+    async def test_processing_generic_error(self, bot_core, mock_bot, sample_job, pipeline):
         """Test handling of generic processing errors."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.side_effect = Exception("Generic error")
+        pipeline.decode.side_effect = Exception("Generic error")
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
@@ -185,9 +219,32 @@ class TestAudioProcessing:
         
         mock_bot.delete_messages.assert_called_once_with(
             entity=sample_job.chat_id,
-            message_ids=sample_job.processing_msg_id
+            message_ids=[sample_job.processing_msg_id]
         )
 
+    async def test_cleanup_groups_deletions_per_chat(self, bot_core, mock_bot):
+        """Test that processing messages finishing together are deleted in one call per chat."""
+        jobs = [
+            Job(chat_id=chat_id, message_id=1, file_id="f", file_name="a.ogg",
+                mime_type="audio/ogg", file_size=1024, processing_msg_id=msg_id)
+            for chat_id, msg_id in [(1, 10), (1, 11), (2, 20)]
+        ]
+        
+        await asyncio.gather(*(bot_core.cleanup_processing_message(job, mock_bot) for job in jobs))
+        
+        assert mock_bot.delete_messages.call_count == 2
+        mock_bot.delete_messages.assert_any_call(entity=1, message_ids=[10, 11])
+        mock_bot.delete_messages.assert_any_call(entity=2, message_ids=[20])
+
+    async def test_cleanup_does_not_wait_for_deletion(self, bot_core, mock_bot, sample_job):
+        """Test that cleanup returns at once and the deletion follows in the background."""
+        flush = bot_core.cleanup_processing_message(sample_job, mock_bot)
+        
+        mock_bot.delete_messages.assert_not_called()
+        await flush
+        mock_bot.delete_messages.assert_called_once()
+        assert not bot_core._delete_tasks
+
     async def test_cleanup_processing_message_fails_silently(self, bot_core, mock_bot, sample_job):
         """Test that cleanup failures are handled silently."""
         mock_bot.delete_messages.side_effect = Exception("Delete failed")
@@ -197,17 +254,15 @@ class TestAudioProcessing:
         
         mock_bot.delete_messages.assert_called_once()
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_duration_estimation(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                     bot_core, mock_bot, sample_job):
+    async def test_duration_estimation(self, bot_core, mock_bot, sample_job, pipeline):
         """Test audio duration estimation."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * (16000 * 120)  # 2 minutes of audio
-        mock_to_thread.return_value = {"text": "Test transcription"}
+        bot_core.status_debounce_seconds = 0.01
+        pipeline.decode.return_value = _AUDIO_2MIN
+        
+        async def slow_transcribe(*args):
+            await asyncio.sleep(0.05)
+            return "Test transcription"
+        pipeline.transcribe.side_effect = slow_transcribe
         
         result = await bot_core.process_audio_job(sample_job, mock_bot, MagicMock())
         
@@ -221,3 +276,323 @@ class TestAudioProcessing:
         # Should show estimated time (2 minutes * 35 seconds/minute = 70 seconds)
         estimation_call = estimation_calls[0][1]['text']
         assert "70 seconds" in estimation_call
+
+
+
+
+class TestStatusPinger:
+    """Test debounced status updates."""
+
+    async def test_only_settled_text_is_sent(self, mock_bot):
+        """Test that quickly replaced status texts never reach Telegram."""
+        status = StatusPinger(mock_bot, 123, 456, delay=0.01)
+        status.set("Downloading...")
+        status.set("Processing...")
+        await asyncio.sleep(0.05)
+        
+        mock_bot.edit_message.assert_called_once_with(entity=123, message=456, text="Processing...")
+
+    async def test_close_drops_pending_update(self, mock_bot):
+        """Test that closing before the delay elapses sends nothing."""
+        status = StatusPinger(mock_bot, 123, 456, delay=0.01)
+        status.set("Processing...")
+        status.close()
+        await asyncio.sleep(0.05)
+        
+        mock_bot.edit_message.assert_not_called()
+
+    async def test_edit_failure_is_logged(self, mock_bot):
+        """Test that a failed status edit doesn't raise into the job."""
+        mock_bot.edit_message.side_effect = Exception("Message not modified")
+        status = StatusPinger(mock_bot, 123, 456, delay=0)
+        status.set("Processing...")
+        await asyncio.sleep(0.01)
+        
+        mock_bot.edit_message.assert_called_once()
+
+    async def test_unchanged_text_not_resent(self, mock_bot):
+        """Test that setting the text already shown costs no edit."""
+        status = StatusPinger(mock_bot, 123, 456, delay=0)
+        status.set("Processing...")
+        await asyncio.sleep(0.01)
+        status.set("Processing...")
+        await asyncio.sleep(0.01)
+        
+        mock_bot.edit_message.assert_called_once()
+
+class TestBatchProcessing:
+    """Test collecting queued jobs into batches and routing results back."""
+
+    @pytest.fixture
+    def batching_core(self):
+        """BotCore on a backend that batches, so next_batch coalesces jobs."""
+        return BotCore(whisper_model="base", max_queue_size=100, backend="faster-whisper", max_batch_size=4)
+
+    def make_jobs(self, count, duration=5.0):
+        return [
+            Job(chat_id=100 + i, message_id=i, file_id=f"file_{i}", file_name=f"audio_{i}.ogg",
+                mime_type="audio/ogg", file_size=1024, processing_msg_id=200 + i, duration=duration)
+            for i in range(count)
+        ]
+
+    async def test_next_batch_collects_waiting_jobs(self, batching_core):
+        """Test that jobs already waiting in the queue are taken together."""
+        for job in self.make_jobs(3):
+            await batching_core.processing_queue.put(job)
+        
+        jobs = await batching_core.next_batch()
+        
+        assert [job.chat_id for job in jobs] == [100, 101, 102]
+        assert batching_core.processing_queue.empty()
+
+    async def test_next_batch_respects_max_batch_size(self, batching_core):
+        """Test that a batch never exceeds max_batch_size."""
+        batching_core.max_batch_size = 2
+        for job in self.make_jobs(3):
+            await batching_core.processing_queue.put(job)
+        
+        jobs = await batching_core.next_batch()
+        
+        assert len(jobs) == 2
+        assert batching_core.processing_queue.qsize() == 1
+
+    async def test_next_batch_waits_briefly_for_more_jobs(self, batching_core):
+        """Test that a job arriving within the batching window joins the batch."""
+        first, second = self.make_jobs(2)
+        await batching_core.processing_queue.put(first)
+        
+        async def late_put():
+            await asyncio.sleep(0.01)
+            await batching_core.processing_queue.put(second)
+        
+        jobs, _ = await asyncio.gather(batching_core.next_batch(), late_put())
+        
+        assert jobs == [first, second]
+
+    async def test_next_batch_single_jobs_for_non_batching_backend(self, bot_core):
+        """Test that a backend transcribing clip by clip gets one job at a time."""
+        assert bot_core.max_batch_size == 1
+        for job in self.make_jobs(3):
+            await bot_core.processing_queue.put(job)
+        
+        jobs = await bot_core.next_batch()
+        
+        assert len(jobs) == 1
+        assert bot_core.processing_queue.qsize() == 2
+
+    async def test_next_batch_leaves_long_clips_queued(self, batching_core):
+        """Test that clips longer than one window, or of unknown length, are never coalesced."""
+        short = self.make_jobs(2)
+        long = self.make_jobs(1, duration=90.0)[0]
+        unknown = self.make_jobs(1, duration=None)[0]
+        for job in (short[0], long, short[1], unknown):
+            await batching_core.processing_queue.put(job)
+        
+        assert await batching_core.next_batch() == [short[0]]
+        assert await batching_core.next_batch() == [long]
+        assert await batching_core.next_batch() == [short[1]]
+        assert await batching_core.next_batch() == [unknown]
+
+    async def test_next_batch_leaves_long_clip_arriving_late_queued(self, batching_core):
+        """Test that a long clip arriving while a batch is collected never leaves the queue."""
+        first = self.make_jobs(1)[0]
+        long = self.make_jobs(1, duration=90.0)[0]
+        await batching_core.processing_queue.put(first)
+        
+        async def late_put():
+            await asyncio.sleep(0.01)
+            await batching_core.processing_queue.put(long)
+        
+        with patch.object(batching_core.processing_queue, 'get_nowait', wraps=batching_core.processing_queue.get_nowait) as mock_get:
+            jobs, _ = await asyncio.gather(batching_core.next_batch(), late_put())
+        
+        assert jobs == [first]
+        mock_get.assert_called_once()  # For the first job only
+        assert batching_core.processing_queue.qsize() == 1
+        assert batching_core.processing_queue.get_nowait() is long
+
+    @patch('bot_core.BotCore._transcribe_batch')
+    async def test_process_batch_routes_results(self, mock_transcribe_batch, bot_core, mock_bot, pipeline):
+        """Test that each batched transcription is sent back to the chat it came from."""
+        jobs = self.make_jobs(3)
+        mock_transcribe_batch.return_value = ["text 0", "text 1", "text 2"]
+        
+        results = await bot_core.process_batch(jobs, mock_bot, MagicMock())
+        
+        assert results == [True, True, True]
+        mock_transcribe_batch.assert_called_once()
+        sent = {call[1]['entity']: call[1]['message'] for call in mock_bot.send_message.call_args_list}
+        assert sent == {100: "Transcription:\n\ntext 0", 101: "Transcription:\n\ntext 1", 102: "Transcription:\n\ntext 2"}
+
+    @patch('bot_core.BotCore._transcribe_batch')
+    async def test_process_batch_skips_failed_downloads(self, mock_transcribe_batch, bot_core, mock_bot, pipeline):
+        """Test that a failed download fails only its own job."""
+        jobs = self.make_jobs(3)
+        pipeline.decode.side_effect = [_AUDIO_1S, Exception("Download failed"), _AUDIO_1S]
+        mock_transcribe_batch.return_value = ["text 0", "text 2"]
+        
+        results = await bot_core.process_batch(jobs, mock_bot, MagicMock())
+        
+        assert results == [True, False, True]
+        assert len(mock_transcribe_batch.call_args[0][1]) == 2
+
+    @patch('bot_core.BotCore._transcribe_batch')
+    async def test_process_batch_falls_back_to_single_files(self, mock_transcribe_batch, bot_core, mock_bot, pipeline):
+        """Test that a batch failure retries files one at a time."""
+        jobs = self.make_jobs(2)
+        mock_transcribe_batch.side_effect = RuntimeError("Out of memory")
+        pipeline.transcribe.side_effect = ["text 0", RuntimeError("Corrupt audio")]
+        
+        results = await bot_core.process_batch(jobs, mock_bot, MagicMock())
+        
+        assert results == [True, False]
+        assert pipeline.transcribe.call_count == 2
+
+    async def test_faster_whisper_batch_trims_silence_first(self, batching_core, mock_bot, pipeline):
+        """Test that a long clip with little speech joins the batch and a silent one is skipped."""
+        jobs = self.make_jobs(3)
+        pipeline.decode.side_effect = [_AUDIO_1S, _AUDIO_90S, _AUDIO_5S]
+        speech = [_AUDIO_1S + 0.1, np.full(16000 * 10, 0.1, dtype=np.float32), _AUDIO_1S[:0]]
+        model = MagicMock()
+        model.feature_extractor.n_samples = 16000 * 30
+        backend = batching_core.backend
+        
+        with patch.object(backend, '_speech_only', side_effect=speech), \
+             patch.object(backend, '_generate_batch', return_value=["one", "two"]) as mock_generate, \
+             patch.object(backend, 'transcribe') as mock_transcribe:
+            results = await batching_core.process_batch(jobs, mock_bot, model)
+        
+        assert results == [True, True, True]
+        mock_generate.assert_called_once_with(model, speech[:2])
+        mock_transcribe.assert_not_called()
+        pipeline.transcribe.assert_not_called()
+
+    @patch('bot_core.BotCore.process_audio_job')
+    async def test_single_job_batch_uses_single_path(self, mock_process, bot_core, mock_bot):
+        """Test that a batch of one goes through the regular single-file path."""
+        mock_process.return_value = True
+        job = self.make_jobs(1)[0]
+        
+        assert await bot_core.process_batch([job], mock_bot, MagicMock()) == [True]
+        mock_process.assert_called_once()
+
+
+class TestTranscriptCache:
+    """Test reuse of transcriptions for files that were already transcribed."""
+
+    def make_job(self, chat_id=12345, file_unique_id="unique_1"):
+        return Job(chat_id=chat_id, message_id=1, file_id="file_1", file_name="voice.ogg",
+                   mime_type="audio/ogg", file_size=1024, processing_msg_id=2,
+                   file_unique_id=file_unique_id)
+
+    async def test_repeat_file_served_from_cache(self, bot_core, mock_bot, pipeline):
+        """Test that a forwarded file is answered without downloading or transcribing again."""
+        pipeline.transcribe.return_value = "Cached text"
+        await bot_core.process_audio_job(self.make_job(chat_id=1), mock_bot, MagicMock())
+        
+        await bot_core.queue_audio_job(2, 1, AudioMessage("file_1", 1024, "audio/ogg", "voice.ogg", "unique_1"), 2)
+        job = await bot_core.processing_queue.get()
+        result = await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        assert result is True
+        assert pipeline.decode.call_count == 1
+        assert pipeline.transcribe.call_count == 1
+        assert mock_bot.send_message.call_args[1]['entity'] == 2
+        assert "Cached text" in mock_bot.send_message.call_args[1]['message']
+        assert bot_core.get_user_queue_count(2) == 0
+
+    async def test_cache_evicts_least_recently_used(self, bot_core):
+        """Test that the cache stays bounded and keeps recently used entries."""
+        bot_core.transcript_cache_size = 2
+        bot_core.cache_transcription("a", "text a")
+        bot_core.cache_transcription("b", "text b")
+        bot_core.get_cached_transcription("a")
+        bot_core.cache_transcription("c", "text c")
+        
+        assert bot_core.get_cached_transcription("a") == "text a"
+        assert bot_core.get_cached_transcription("b") is None
+        assert bot_core.get_cached_transcription("c") == "text c"
+
+    async def test_files_without_unique_id_never_share_a_transcription(self, bot_core, mock_bot, pipeline):
+        """Test that audio without a file_unique_id is transcribed every time."""
+        pipeline.transcribe.side_effect = ["First text", "Second text"]
+        for chat_id, file_id in ((1, "file_1"), (2, "file_2")):
+            await bot_core.queue_audio_job(chat_id, 1, AudioMessage(file_id, 1024, "audio/ogg", "voice.ogg"), 2)
+            job = await bot_core.processing_queue.get()
+            await bot_core.process_audio_job(job, mock_bot, MagicMock())
+        
+        assert pipeline.transcribe.call_count == 2
+        assert "Second text" in mock_bot.send_message.call_args[1]['message']
+
+    async def test_cache_disabled(self, bot_core):
+        """Test that a cache size of zero stores nothing."""
+        bot_core.transcript_cache_size = 0
+        bot_core.cache_transcription("a", "text a")
+        
+        assert bot_core.get_cached_transcription("a") is None
+
+class TestDecodeAudio:
+    """Test ffmpeg decoding, using a stand-in ffmpeg that echoes its stdin as PCM."""
+
+    @pytest.fixture
+    def fake_ffmpeg(self, tmp_path, monkeypatch):
+        """Put an 'ffmpeg' on PATH that copies stdin (or the input file) to stdout."""
+        script = tmp_path / "ffmpeg"
+        script.write_text(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            "src = sys.argv[sys.argv.index('-i') + 1]\n"
+            "if src.endswith('.broken'):\n"
+            "    sys.stderr.write('Invalid data found when processing input')\n"
+            "    sys.exit(1)\n"
+            "data = sys.stdin.buffer.read() if src == 'pipe:0' else open(src, 'rb').read()\n"
+            "sys.stdout.buffer.write(data)\n"
+        )
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        return tmp_path
+
+    async def test_decode_streamed_chunks(self, fake_ffmpeg):
+        """Test that chunks are piped through ffmpeg and scaled to float32."""
+        pcm = np.array([0, 16384, -32768], dtype=np.int16).tobytes()
+        
+        async def chunks():
+            yield pcm[:3]
+            yield pcm[3:]
+        
+        audio = await decode_audio(chunks())
+        
+        assert audio.dtype == np.float32
+        np.testing.assert_allclose(audio, [0.0, 0.5, -1.0])
+
+    async def test_decode_file_path(self, fake_ffmpeg):
+        """Test that a file path is handed to ffmpeg directly."""
+        path = fake_ffmpeg / "audio.m4a"
+        path.write_bytes(np.array([8192], dtype=np.int16).tobytes())
+        
+        audio = await decode_audio(str(path))
+        
+        np.testing.assert_allclose(audio, [0.25])
+
+    async def test_decode_reuses_buffer(self, fake_ffmpeg):
+        """Test that samples are written into a large enough buffer and a small one is replaced."""
+        path = fake_ffmpeg / "audio.m4a"
+        path.write_bytes(np.array([8192, -8192], dtype=np.int16).tobytes())
+        
+        buffer = np.ones(4, dtype=np.float32)
+        audio = await decode_audio(str(path), buffer)
+        assert audio.base is buffer
+        np.testing.assert_allclose(buffer[:2], [0.25, -0.25])
+        
+        small = np.ones(1, dtype=np.float32)
+        audio = await decode_audio(str(path), small)
+        assert audio.base is not small
+        np.testing.assert_allclose(audio, [0.25, -0.25])
+
+    async def test_decode_failure_raises(self, fake_ffmpeg):
+        """Test that a non-zero ffmpeg exit surfaces its error output."""
+        path = fake_ffmpeg / "audio.broken"
+        path.write_bytes(b"")
+        
+        with pytest.raises(RuntimeError, match="Invalid data"):
+            await decode_audio(str(path))
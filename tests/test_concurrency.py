@@ -1,76 +1,60 @@
 import pytest
 import asyncio
-from unittest.mock import AsyncMock, MagicMock, patch
+from contextvars import ContextVar
+from itertools import chain, repeat
+import numpy as np
+from dataclasses import replace
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
 from bot_core import Job, AudioMessage
 
 pytestmark = pytest.mark.asyncio
 
+# Decoder output as decode_audio returns it: float32 samples at 16 kHz
+_AUDIO_SHORT = np.zeros(800, dtype=np.float32)  # 0.05 seconds
+_AUDIO_1S = np.zeros(16000, dtype=np.float32)
 
-class TestConcurrency:
-    """Test concurrent processing behavior."""
+# The job being processed in the current task, so mocks can fail specific jobs
+# regardless of the order in which concurrent calls reach them
+_current_job = ContextVar("current_job")
 
-    def create_test_jobs(self, count=3):
-        """Create test jobs for concurrent testing."""
-        return [
-            Job(chat_id=12345 + i, message_id=i, file_id=f"test_file_{i}", 
-                file_name=f"test_audio_{i}.ogg", mime_type="audio/ogg", 
-                file_size=1024 * 1024, processing_msg_id=i + 100)
-            for i in range(count)
-        ]
 
-    def setup_processing_mocks(self, bot_core, mock_tempdir, mock_whisper, mock_to_thread, transcription="Test"):
-        """Standard mock setup for processing tests."""
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": transcription}
+async def process_as_current(bot_core, job, bot, model):
+    """Run process_audio_job with job visible to mocks through _current_job."""
+    _current_job.set(job)
+    return await bot_core.process_audio_job(job, bot, model)
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_transcription_with_separate_models(self, mock_tempdir, mock_to_thread, mock_whisper, bot_core, mock_bot):
+
+class TestConcurrency:
+    """Test concurrent processing behavior."""
+
+    async def test_concurrent_transcription_with_separate_models(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test that concurrent transcriptions work with separate model instances."""
-        sample_jobs = self.create_test_jobs()
-        self.setup_processing_mocks(bot_core, mock_tempdir, mock_whisper, mock_to_thread)
         
-        # Track concurrent execution timing
-        call_times = []
-        async def mock_transcribe_with_delay(*args):
-            call_times.append(asyncio.get_event_loop().time())
-            await asyncio.sleep(0.1)
-            return {"text": f"Transcription {len(call_times)}"}
-        mock_to_thread.side_effect = mock_transcribe_with_delay
+        # Each call waits until every job is inside transcription, which only
+        # happens if the calls run concurrently rather than one after another
+        all_started = asyncio.Barrier(len(sample_jobs))
+        async def mock_transcribe_with_barrier(*args):
+            await asyncio.wait_for(all_started.wait(), timeout=1)
+            return "Transcription"
+        pipeline.transcribe.side_effect = mock_transcribe_with_barrier
         
         # Start multiple jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock()) 
+            bot_core.process_audio_job(job, mock_bot, pipeline.model) 
             for job in sample_jobs
         ]
         
         results = await asyncio.gather(*tasks)
         
-        # All jobs should succeed
+        # All jobs should succeed, so no call timed out waiting for the others
         assert all(results)
         
         # Verify transcribe was called for each job
-        assert mock_to_thread.call_count == len(sample_jobs)
-        
-        # Verify calls happened concurrently (not serialized)
-        # With separate models, calls should start close together
-        max_time_diff = max(call_times) - min(call_times)
-        assert max_time_diff < 0.05, f"Calls should start concurrently, max diff was {max_time_diff}"
+        assert pipeline.transcribe.call_count == len(sample_jobs)
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_separate_models_prevent_tensor_corruption(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                           bot_core, mock_bot, sample_jobs):
+    async def test_separate_models_prevent_tensor_corruption(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test that separate model instances prevent tensor corruption errors."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        
         # Simulate tensor corruption that would happen without proper locking
         corruption_count = 0
         
@@ -78,42 +62,30 @@ class TestConcurrency:
             nonlocal corruption_count
             # With separate model instances, no corruption should occur
             corruption_count += 1
-            await asyncio.sleep(0.05)  # Small delay
-            return {"text": f"Safe transcription {corruption_count}"}
+            await asyncio.sleep(0)  # Let the other jobs interleave
+            return f"Safe transcription {corruption_count}"
         
-        mock_to_thread.side_effect = mock_transcribe_with_potential_corruption
+        pipeline.transcribe.side_effect = mock_transcribe_with_potential_corruption
         
-        tasks = [bot_core.process_audio_job(job, mock_bot, MagicMock()) for job in sample_jobs]
+        tasks = [bot_core.process_audio_job(job, mock_bot, pipeline.model) for job in sample_jobs]
         
         # All should complete without the tensor error
         results = await asyncio.gather(*tasks)
         assert all(results), "All jobs should complete successfully with separate models"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_processing_after_error(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                   bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_processing_after_error(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test that concurrent processing works even when some jobs fail."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        
-        # Mix of successful and failing calls
-        call_count = 0
+        # Mix of successful and failing calls: the second job fails
         async def mock_transcribe_with_mixed_results(*args):
-            nonlocal call_count
-            call_count += 1
-            if call_count == 2:  # Second call fails
+            if _current_job.get().file_id == "test_file_1":
                 raise RuntimeError("Simulated transcription error")
-            return {"text": f"Success {call_count}"}
+            return "Success"
         
-        mock_to_thread.side_effect = mock_transcribe_with_mixed_results
+        pipeline.transcribe.side_effect = mock_transcribe_with_mixed_results
         
         # Process multiple jobs concurrently - some will fail, some succeed
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock()) 
+            process_as_current(bot_core, job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -124,82 +96,59 @@ class TestConcurrency:
         assert results[1] is False, "Second job should fail"  
         assert results[2] is True, "Third job should succeed despite second job's failure"
 
-    async def test_concurrent_downloads_and_processing(self, bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_downloads_and_processing(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test that downloads and other operations happen concurrently."""
         # Downloads and file processing should be concurrent
         
-        download_times = []
+        # Each download waits for the other, so they must be in flight together
+        both_downloading = asyncio.Barrier(2)
         
-        async def mock_download_media(path):
-            download_times.append(asyncio.get_event_loop().time())
-            await asyncio.sleep(0.05)  # Simulate download time
+        async def mock_iter_download(media, request_size):
+            await asyncio.wait_for(both_downloading.wait(), timeout=1)
+            yield b"chunk"
         
-        mock_message = AsyncMock()
-        mock_message.download_media = mock_download_media
-        mock_bot.get_messages.return_value = mock_message
+        async def mock_decode_stream(chunks, out=None):
+            async for _ in chunks:
+                pass
+            return _AUDIO_1S
         
-        with patch('bot_core.whisper') as mock_whisper, \
-             patch('tempfile.TemporaryDirectory') as mock_tempdir, \
-             patch('bot_core.asyncio.to_thread') as mock_to_thread:
-            
-            mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-            mock_whisper.load_audio.return_value = [0] * 16000
-            mock_to_thread.return_value = {"text": "Test"}
-            bot_core.model = MagicMock()
-            
-            # Start multiple jobs
-            tasks = [
-                bot_core.process_audio_job(job, mock_bot, MagicMock()) 
-                for job in sample_jobs[:2]  # Just test 2 to keep it simple
-            ]
-            
-            await asyncio.gather(*tasks)
-            
-            # Downloads should happen concurrently (close in time)
-            time_diff = abs(download_times[1] - download_times[0])
-            assert time_diff < 0.1, "Downloads should happen concurrently"
+        mock_bot.iter_download.side_effect = mock_iter_download
+        
+        pipeline.decode.side_effect = mock_decode_stream
+        
+        # Start multiple jobs
+        tasks = [
+            bot_core.process_audio_job(job, mock_bot, pipeline.model) 
+            for job in sample_jobs[:2]  # Just test 2 to keep it simple
+        ]
+        
+        results = await asyncio.gather(*tasks)
+        
+        # A serialized download would have timed out at the barrier
+        assert all(results), "Downloads should happen concurrently"
 
 
 class TestConcurrencyFailureScenarios:
     """Test concurrent processing under failure conditions."""
 
-    def create_test_jobs(self, count=5):
-        """Create test jobs for failure testing."""
-        return [
-            Job(chat_id=12345 + i, message_id=i, file_id=f"test_file_{i}", 
-                file_name=f"test_audio_{i}.ogg", mime_type="audio/ogg", 
-                file_size=1024 * 1024, processing_msg_id=i + 100)
-            for i in range(count)
-        ]
-
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_network_timeout_failures(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                      bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_network_timeout_failures(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test behavior when some downloads timeout during concurrent processing."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": "Success"}
+        pipeline.transcribe.return_value = "Success"
         
         # Simulate network timeouts for some downloads
         async def mock_get_messages_with_timeouts(chat_id, ids):
             if ids in [1, 3]:  # message_ids for test_file_1 and test_file_3
-                await asyncio.sleep(0.05)  # Small delay before timeout
+                await asyncio.sleep(0)  # Yield before timing out
                 raise asyncio.TimeoutError("Network timeout")
             
-            # Successful download
-            mock_message = AsyncMock()
-            mock_message.download_media = AsyncMock()
-            return mock_message
+            # Successful download: the audio is streamed from message.media
+            return SimpleNamespace(media=object())
         
         mock_bot.get_messages.side_effect = mock_get_messages_with_timeouts
         
         # Process jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            bot_core.process_audio_job(job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -212,33 +161,18 @@ class TestConcurrencyFailureScenarios:
         assert successful_count == 3, "3 jobs should succeed"
         assert failed_count == 2, "2 jobs should fail due to timeout"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_disk_space_failures(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                 bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_disk_space_failures(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test behavior when disk space runs out during concurrent processing."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": "Success"}
-        
-        # Simulate disk space issues for file creation
-        download_count = 0
-        async def mock_download_with_disk_error(path):
-            nonlocal download_count
-            download_count += 1
-            if download_count >= 3:  # First 2 succeed, rest fail
-                raise OSError("No space left on device")
+        pipeline.transcribe.return_value = "Success"
         
+        # Simulate disk space issues for file creation: first 2 succeed, rest fail
         mock_message = AsyncMock()
-        mock_message.download_media.side_effect = mock_download_with_disk_error
+        mock_message.download_media.side_effect = [None] * 2 + [OSError("No space left on device")] * 3
         mock_bot.get_messages.return_value = mock_message
         
-        # Process jobs concurrently
+        # Only MP4-family containers are spooled to disk; everything else streams
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            bot_core.process_audio_job(replace(job, mime_type="audio/mp4"), mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -251,31 +185,15 @@ class TestConcurrencyFailureScenarios:
         assert len(successful_jobs) == 2, "First 2 jobs should succeed"
         assert len(failed_jobs) == 3, "Last 3 jobs should fail with disk error"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_memory_pressure_simulation(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                        bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_memory_pressure_simulation(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test behavior under simulated memory pressure."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        
-        # Simulate memory pressure affecting audio loading
-        load_count = 0
-        def mock_load_audio_with_memory_pressure(path):
-            nonlocal load_count
-            load_count += 1
-            if load_count >= 4:  # Simulate memory issues after 3 loads
-                raise MemoryError("Cannot allocate memory for audio loading")
-            return [0] * 16000  # Normal audio data
-        
-        mock_whisper.load_audio.side_effect = mock_load_audio_with_memory_pressure
-        mock_to_thread.return_value = {"text": "Success"}
+        # Simulate memory pressure affecting audio loading after 3 loads
+        pipeline.decode.side_effect = [_AUDIO_1S] * 3 + [MemoryError("Cannot allocate memory for audio loading")] * 2
+        pipeline.transcribe.return_value = "Success"
         
         # Process jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            bot_core.process_audio_job(job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -288,34 +206,18 @@ class TestConcurrencyFailureScenarios:
         assert successful_count == 3, "First 3 jobs should succeed before memory pressure"
         assert failed_count == 2, "Last 2 jobs should fail with memory error"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_bot_api_rate_limiting(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                   bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_bot_api_rate_limiting(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test behavior when Bot API rate limiting kicks in."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        mock_to_thread.return_value = {"text": "Rate limited response"}
-        
-        # Simulate rate limiting on bot API calls
-        api_call_count = 0
-        async def mock_api_with_rate_limit(*args, **kwargs):
-            nonlocal api_call_count
-            api_call_count += 1
-            if api_call_count > 10:  # Rate limit after 10 calls
-                await asyncio.sleep(0.1)  # Simulate forced delay
-                raise Exception("Rate limit exceeded")
-            return MagicMock()
-        
-        mock_bot.edit_message.side_effect = mock_api_with_rate_limit
-        mock_bot.send_message.side_effect = mock_api_with_rate_limit
+        pipeline.transcribe.return_value = "Rate limited response"
+        
+        # Simulate rate limiting on bot API calls: edits and sends share one budget of 10 calls
+        api_calls = chain(repeat(MagicMock(), 10), repeat(Exception("Rate limit exceeded")))
+        mock_bot.edit_message.side_effect = api_calls
+        mock_bot.send_message.side_effect = api_calls
         
         # Process jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            bot_core.process_audio_job(job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -326,70 +228,45 @@ class TestConcurrencyFailureScenarios:
         successful_count = sum(1 for r in results if r is True)
         assert successful_count >= 1, "At least some jobs should succeed before rate limiting"
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_transcription_model_failures(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                          bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_transcription_model_failures(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test resilience when Whisper models fail intermittently."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
-        
-        # Simulate intermittent model failures
-        transcription_count = 0
+        # Simulate intermittent model failures on the 2nd and 4th jobs
         async def mock_transcribe_with_failures(*args):
-            nonlocal transcription_count
-            transcription_count += 1
-            
-            # Fail on 2nd and 4th attempts
-            if transcription_count in [2, 4]:
+            if _current_job.get().file_id in ("test_file_1", "test_file_3"):
                 raise RuntimeError("Model inference failed")
-            
-            return {"text": f"Success {transcription_count}"}
+            return "Success"
         
-        mock_to_thread.side_effect = mock_transcribe_with_failures
+        pipeline.transcribe.side_effect = mock_transcribe_with_failures
         
         # Process jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            process_as_current(bot_core, job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
         results = await asyncio.gather(*tasks)
         
-        # Should have mixed results
-        successful_count = sum(1 for r in results if r is True)
-        failed_count = sum(1 for r in results if r is False)
-        
-        assert successful_count == 3, "3 jobs should succeed"
-        assert failed_count == 2, "2 jobs should fail with model errors"
+        # Exactly the failing jobs fail
+        assert results == [True, False, True, False, True]
 
-    @patch('bot_core.whisper')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_concurrent_file_corruption_detection(self, mock_tempdir, mock_whisper,
-                                                       bot_core, mock_bot, sample_jobs):
+    async def test_concurrent_file_corruption_detection(self, bot_core, mock_bot, sample_jobs, pipeline):
         """Test detection of corrupted files during concurrent processing."""
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        
         # Simulate corrupted audio files
-        def mock_load_audio_corruption(path):
+        def mock_load_audio_corruption(source, out=None):
             # Simulate different types of corruption
-            if "test_file_1" in path:
-                return []  # Empty audio (corrupted)
-            elif "test_file_3" in path:
-                return [0] * 800  # Too short (0.05 seconds)
+            file_id = _current_job.get().file_id
+            if file_id == "test_file_1":
+                return _AUDIO_SHORT[:0]  # Empty audio (corrupted)
+            elif file_id == "test_file_3":
+                return _AUDIO_SHORT  # Too short (0.05 seconds)
             else:
-                return [0] * 16000  # Valid audio
+                return _AUDIO_1S  # Valid audio
         
-        mock_whisper.load_audio.side_effect = mock_load_audio_corruption
+        pipeline.decode.side_effect = mock_load_audio_corruption
         
         # Process jobs concurrently
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            process_as_current(bot_core, job, mock_bot, pipeline.model)
             for job in sample_jobs
         ]
         
@@ -400,21 +277,16 @@ class TestConcurrencyFailureScenarios:
         
         # Verify appropriate error messages were sent
         send_calls = mock_bot.send_message.call_args_list
-        error_messages = [call[1]['text'] for call in send_calls]
+        error_messages = [str(call[1]['message']) for call in send_calls]
         
         # Should have messages about empty and short audio
         empty_audio_msgs = [msg for msg in error_messages if "empty or corrupted" in msg]
         short_audio_msgs = [msg for msg in error_messages if "too short" in msg]
         
-        # Check that corrupted files are handled gracefully
-        # The specific messages depend on the file paths used during processing
-        print(f"Debug - Send message calls: {len(send_calls)}")
-        print(f"Debug - Error messages: {error_messages}")
-        
-        # At minimum, corrupted files should be processed without crashing
-        # We expect 2 corrupted files (empty and short) to send validation messages
-        if len(error_messages) > 0:
-            assert len(empty_audio_msgs + short_audio_msgs) >= 0, "Should handle corrupted files gracefully"
+        # Each corrupted file gets its own validation message
+        assert len(empty_audio_msgs) == 1
+        assert len(short_audio_msgs) == 1
+        assert pipeline.transcribe.call_count == 3
 
     async def test_concurrent_queue_overflow_recovery(self, bot_core):
         """Test recovery when queue overflows during concurrent operations."""
@@ -422,9 +294,10 @@ class TestConcurrencyFailureScenarios:
         audio = AudioMessage("file_123", 1024*1024, "audio/ogg", "test.ogg")
         
         # Add exactly MAX_QUEUE_SIZE jobs
-        for i in range(bot_core.max_queue_size):
-            success, _ = await bot_core.queue_audio_job(12345+i, i, audio, i+100)
-            assert success is True
+        results = await asyncio.gather(*(
+            bot_core.queue_audio_job(12345+i, i, audio, i+100) for i in range(bot_core.max_queue_size)
+        ))
+        assert all(success for success, _ in results)
         
         # Try to add more one at a time - should all be rejected
         overflow_results = []
@@ -438,11 +311,7 @@ class TestConcurrencyFailureScenarios:
         # Queue should still be at capacity
         assert bot_core.is_queue_full()
 
-    @patch('bot_core.whisper')
-    @patch('bot_core.asyncio.to_thread')
-    @patch('tempfile.TemporaryDirectory')
-    async def test_graceful_degradation_under_load(self, mock_tempdir, mock_to_thread, mock_whisper,
-                                                  bot_core, mock_bot):
+    async def test_graceful_degradation_under_load(self, bot_core, mock_bot, pipeline):
         """Test that the system degrades gracefully under heavy load."""
         # Create a large number of jobs to simulate load
         heavy_load_jobs = [
@@ -457,44 +326,39 @@ class TestConcurrencyFailureScenarios:
             ) for i in range(10)  # 10 concurrent jobs
         ]
         
-        # Setup mocks
-        bot_core.model = MagicMock()
-        mock_tempdir.return_value.__enter__.return_value = "/tmp/test"
-        mock_whisper.load_audio.return_value = [0] * 16000
         
-        # Add realistic processing delays and occasional failures
-        import random
+        # Failures under load (50% chance), drawn once from a seeded generator
+        fails = np.random.default_rng(0).random(len(heavy_load_jobs)) > 0.5
+        calls = iter(fails)
         async def mock_realistic_processing(*args):
-            # Simulate realistic processing time
-            await asyncio.sleep(0.05 + random.uniform(0, 0.1))  # Variable processing time
+            await asyncio.sleep(0)  # Let the other jobs interleave
             
-            # Simulate random failures under load (50% chance)
-            if random.random() > 0.5:  
+            if next(calls):
                 raise RuntimeError("System under heavy load")
             
-            return {"text": "Load test result"}
+            return "Load test result"
         
-        mock_to_thread.side_effect = mock_realistic_processing
+        pipeline.transcribe.side_effect = mock_realistic_processing
         
         # Process all jobs concurrently
-        start_time = asyncio.get_event_loop().time()
+        now = asyncio.get_running_loop().time
+        start_time = now()
         tasks = [
-            bot_core.process_audio_job(job, mock_bot, MagicMock())
+            bot_core.process_audio_job(job, mock_bot, pipeline.model)
             for job in heavy_load_jobs
         ]
         
         results = await asyncio.gather(*tasks)
-        end_time = asyncio.get_event_loop().time()
+        end_time = now()
         
         # System should handle most jobs successfully but may fail some under load
         successful_count = sum(1 for r in results if r is True)
         failed_count = sum(1 for r in results if r is False)
         total_time = end_time - start_time
         
-        # In concurrent execution, the exact success/failure distribution is unpredictable
-        # But we should have both successes and failures under load
+        # Exactly the drawn failures fail, and every other job goes through
         total_processed = successful_count + failed_count
         assert total_processed == 10, f"Should process all 10 jobs, got {total_processed}"
-        assert successful_count >= 1, f"Should have at least some successful jobs, got {successful_count}"
-        assert failed_count >= 1, f"Should have some failures under load, got {failed_count}"
+        assert 0 < fails.sum() < len(fails), "The seed should produce both outcomes"
+        assert failed_count == fails.sum(), f"Expected {fails.sum()} failures, got {failed_count}"
         assert total_time < 2.0, "Should complete within reasonable time despite load"
\ No newline at end of file
@@ -2,7 +2,7 @@ import pytest
 import os
 import asyncio
 from unittest.mock import patch, MagicMock
-from bot_core import BotCore, AudioMessage
+from bot_core import BotCore, AudioMessage, _pick_compute_type
 import main
 
 
@@ -17,6 +17,8 @@ class TestConfiguration:
         assert bot_core.num_workers == 2
         assert bot_core.max_file_size == 2 * 1024 * 1024 * 1024  # 2GB
         assert bot_core.max_queue_size == 100
+        assert bot_core.backend.name == "faster-whisper"
+        assert bot_core.backend.compute_type == _pick_compute_type()
 
     def test_bot_core_custom_configuration(self):
         """Test BotCore with custom configuration values."""
@@ -32,98 +34,135 @@ class TestConfiguration:
         assert bot_core.max_file_size == 1024 * 1024 * 1024
         assert bot_core.max_queue_size == 200
 
-    @patch.dict(os.environ, {
-        'WHISPER_MODEL': 'small',
-        'NUM_WORKERS': '3',
-        'TELEGRAM_BOT_TOKEN': 'test_token_123',
-        'API_ID': '12345',
-        'API_HASH': 'test_api_hash'
-    })
     def test_main_environment_variable_parsing(self):
         """Test that main.py correctly reads environment variables."""
-        # Reload the module to pick up new env vars
+        settings = main.Settings.from_env({
+            'WHISPER_MODEL': 'small',
+            'NUM_WORKERS': '3',
+            'TELEGRAM_BOT_TOKEN': 'test_token_123',
+            'API_ID': '12345',
+            'API_HASH': 'test_api_hash'
+        })
+        
+        assert settings.whisper_model == "small"
+        assert settings.num_workers == 3
+        assert settings.telegram_bot_token == "test_token_123"
+        assert settings.api_id == 12345
+        assert settings.api_hash == "test_api_hash"
+
+    @patch.dict(os.environ, {'WHISPER_BACKEND': 'openai', 'WHISPER_COMPUTE_TYPE': 'float16'})
+    def test_main_backend_environment_variables(self):
+        """Test that the module-level settings and bot_core are built from the environment on import."""
         import importlib
         importlib.reload(main)
         
-        assert main.WHISPER_MODEL == "small"
-        assert main.NUM_WORKERS == 3
-        assert main.TELEGRAM_BOT_TOKEN == "test_token_123"
-        assert main.API_ID == 12345
-        assert main.API_HASH == "test_api_hash"
+        assert main.WHISPER_BACKEND == "openai"
+        assert main.WHISPER_COMPUTE_TYPE == "float16"
+        assert main.bot_core.backend.name == "openai"
 
-    @patch.dict(os.environ, {}, clear=True)
     def test_main_default_environment_values(self):
         """Test default values when environment variables are not set."""
-        import importlib
-        importlib.reload(main)
+        settings = main.Settings.from_env({})
         
-        assert main.WHISPER_MODEL == "base"
-        assert main.NUM_WORKERS == 2
-        assert main.TELEGRAM_BOT_TOKEN is None
-        assert main.API_ID == 0
-        assert main.API_HASH == ""
+        assert settings.whisper_model == "base"
+        assert settings.num_workers == 2
+        assert settings.telegram_bot_token is None
+        assert settings.api_id == 0
+        assert settings.api_hash == ""
+        assert settings.whisper_backend == "faster-whisper"
+        assert settings.whisper_compute_type is None
+        assert settings.max_batch_size == 4
+        assert settings.transcript_cache_size == 1000
+        assert settings.compile_encoder is False
+
+    @pytest.mark.parametrize("flags, expected", [
+        ("fpu sse2 avx2 avx512f avx512_vnni", "int8"),
+        ("fpu sse2 avx2 amx_bf16 amx_int8", "int8"),
+        ("fpu sse2 avx2", "int8_float32"),
+        ("fpu sse2", "float32"),
+    ])
+    def test_compute_type_picked_from_cpu_flags(self, tmp_path, flags, expected):
+        """Test that the compute type follows the CPU's int8 capabilities."""
+        cpuinfo = tmp_path / "cpuinfo"
+        cpuinfo.write_text(f"processor\t: 0\nflags\t\t: {flags}\n")
+        
+        with patch('bot_core.CPUINFO_PATH', str(cpuinfo)):
+            assert _pick_compute_type() == expected
+            assert BotCore().backend.compute_type == expected
+            assert BotCore(compute_type="float16").backend.compute_type == "float16"
+
+    def test_compute_type_on_cuda(self, caplog):
+        """Test that a visible CUDA GPU gets int8 weights with float16 activations, logged as a GPU pick."""
+        with patch('bot_core.ctranslate2') as mock_ctranslate2, caplog.at_level("INFO", logger="bot_core"):
+            mock_ctranslate2.get_cuda_device_count.return_value = 1
+            assert _pick_compute_type() == "int8_float16"
+            BotCore()
+        
+        assert "Using compute type 'int8_float16' picked for the CUDA GPU" in caplog.text
+
+    def test_compute_type_not_picked_for_backends_ignoring_it(self, caplog):
+        """Test that no compute type is picked or logged for whispercpp or a GPU openai model."""
+        with patch('bot_core._pick_compute_type') as mock_pick, caplog.at_level("INFO", logger="bot_core"):
+            BotCore(backend="whispercpp")
+            with patch('bot_core.torch') as mock_torch:
+                mock_torch.cuda.is_available.return_value = True
+                mock_torch.cuda.device_count.return_value = 1
+                BotCore(backend="openai")
+        
+        mock_pick.assert_not_called()
+        assert "compute type" not in caplog.text
+
+    def test_compute_type_default_without_cpu_flags(self, tmp_path):
+        """Test the fallback when /proc/cpuinfo is missing or has no x86 flags."""
+        with patch('bot_core.CPUINFO_PATH', str(tmp_path / "missing")):
+            assert _pick_compute_type() == "int8"
+        
+        cpuinfo = tmp_path / "cpuinfo"
+        cpuinfo.write_text("processor\t: 0\nFeatures\t: fp asimd\n")
+        with patch('bot_core.CPUINFO_PATH', str(cpuinfo)):
+            assert _pick_compute_type() == "int8"
 
-    @patch.dict(os.environ, {'NUM_WORKERS': 'invalid_number'})
     def test_invalid_num_workers_environment_variable(self):
         """Test handling of invalid NUM_WORKERS environment variable."""
         with pytest.raises(ValueError, match="invalid literal for int()"):
-            import importlib
-            importlib.reload(main)
+            main.Settings.from_env({'NUM_WORKERS': 'invalid_number'})
 
-    @patch.dict(os.environ, {'NUM_WORKERS': '0'})
     def test_zero_workers_configuration(self):
         """Test configuration with zero workers."""
-        import importlib
-        importlib.reload(main)
-        
-        assert main.NUM_WORKERS == 0
+        assert main.Settings.from_env({'NUM_WORKERS': '0'}).num_workers == 0
 
-    @patch.dict(os.environ, {'NUM_WORKERS': '10'})
     def test_high_worker_count_configuration(self):
         """Test configuration with high worker count."""
-        import importlib
-        importlib.reload(main)
-        
-        assert main.NUM_WORKERS == 10
+        assert main.Settings.from_env({'NUM_WORKERS': '10'}).num_workers == 10
 
-    def test_file_size_limits_configuration(self):
+    @pytest.mark.parametrize("file_size, should_be_valid", [
+        (1 * 1024 * 1024, True),                    # 1MB - should be valid
+        (100 * 1024 * 1024, True),                  # 100MB - should be valid
+        (1024 * 1024 * 1024, True),                 # 1GB - should be valid
+        (3 * 1024 * 1024 * 1024, False),            # 3GB - over default 2GB limit
+    ], ids=["1MB", "100MB", "1GB", "3GB"])
+    def test_file_size_limits_configuration(self, bot_core_2gb, file_size, should_be_valid):
         """Test different file size limit configurations."""
-        test_cases = [
-            (1 * 1024 * 1024, True),                    # 1MB - should be valid
-            (100 * 1024 * 1024, True),                  # 100MB - should be valid
-            (1024 * 1024 * 1024, True),                 # 1GB - should be valid  
-            (3 * 1024 * 1024 * 1024, False),            # 3GB - over default 2GB limit
-        ]
-        
-        bot_core = BotCore(max_file_size=2 * 1024 * 1024 * 1024)  # 2GB
+        audio = AudioMessage(
+            file_id="test",
+            file_size=file_size,
+            mime_type="audio/ogg",
+            file_name="test.ogg"
+        )
         
-        for file_size, should_be_valid in test_cases:
-            audio = AudioMessage(
-                file_id="test",
-                file_size=file_size,
-                mime_type="audio/ogg",
-                file_name="test.ogg"
-            )
-            
-            error = bot_core.validate_audio_file(audio)
-            if should_be_valid:
-                assert error is None, f"File size {file_size} should be valid"
-            else:
-                assert error is not None, f"File size {file_size} should be invalid"
-                assert "2 GB" in error
+        error = bot_core_2gb.validate_audio_file(audio)
+        if should_be_valid:
+            assert error is None, f"File size {file_size} should be valid"
+        else:
+            assert error is not None, f"File size {file_size} should be invalid"
+            assert "2 GB" in error
 
-    def test_queue_size_limits_configuration(self):
+    @pytest.mark.parametrize("max_size", [1, 50, 100, 500], ids=["minimal", "medium", "default", "large"])
+    def test_queue_size_limits_configuration(self, max_size):
         """Test different queue size configurations."""
-        test_configs = [
-            (1, 1),    # Minimal queue
-            (50, 50),  # Medium queue
-            (100, 100), # Default queue
-            (500, 500), # Large queue
-        ]
-        
-        for max_size, expected_size in test_configs:
-            bot_core = BotCore(max_queue_size=max_size)
-            assert bot_core.max_queue_size == expected_size
+        bot_core = BotCore(max_queue_size=max_size)
+        assert bot_core.max_queue_size == max_size
+        assert bot_core.processing_queue.maxsize == max_size
 
     @pytest.mark.asyncio
     async def test_queue_behavior_with_different_sizes(self):
@@ -141,41 +180,39 @@ class TestConfiguration:
         assert success3 is False
         assert "queue is full" in error
 
-    def test_whisper_model_configurations(self):
+    @pytest.mark.parametrize("model", ["tiny", "base", "small", "medium", "large"])
+    def test_whisper_model_configurations(self, model):
         """Test different Whisper model configurations."""
-        valid_models = ["tiny", "base", "small", "medium", "large"]
-        
-        for model in valid_models:
-            bot_core = BotCore(whisper_model=model)
-            assert bot_core.whisper_model == model
+        assert BotCore(whisper_model=model).whisper_model == model
 
-    def test_whisper_model_loading_with_different_models(self):
+    @patch('bot_core.whisper')
+    def test_whisper_model_loading_with_different_models(self, mock_whisper):
         """Test loading different Whisper model sizes."""
         models_to_test = ["tiny", "base", "small", "medium", "large"]
+        mock_model = MagicMock()
+        mock_whisper.load_model.return_value = mock_model
         
         for model_name in models_to_test:
-            with patch('bot_core.whisper') as mock_whisper:
-                # Create fresh mock for each test
-                mock_model = MagicMock()
-                mock_whisper.load_model.return_value = mock_model
-                
-                bot_core = BotCore(whisper_model=model_name)
-                result = bot_core.get_worker_model("test_worker")
-                
-                assert result == mock_model
-                mock_whisper.load_model.assert_called_with(model_name)
-                assert bot_core.models["test_worker"] == mock_model
+            bot_core = BotCore(whisper_model=model_name, backend="openai")
+            result = bot_core.get_worker_model("test_worker")
+            
+            assert result is mock_model
+            mock_whisper.load_model.assert_called_with(model_name, device="cpu")
+            assert BotCore._MODEL_CACHE[(*bot_core._model_key, "cpu")] is mock_model
+        
+        # Each size is cached under its own key, so every one was loaded once
+        assert mock_whisper.load_model.call_count == len(models_to_test)
 
     def test_whisper_model_loading_failure_handling(self):
         """Test handling of Whisper model loading failures."""
         with patch('bot_core.whisper') as mock_whisper:
             mock_whisper.load_model.side_effect = Exception("Model not found")
             
-            bot_core = BotCore(whisper_model="nonexistent")
+            bot_core = BotCore(whisper_model="nonexistent", backend="openai")
             result = bot_core.get_worker_model("test_worker")
             
             assert result is None
-            assert "test_worker" not in bot_core.models
+            assert (*bot_core._model_key, "cpu") not in BotCore._MODEL_CACHE
 
     def test_constants_configuration(self):
         """Test that constants are properly configured."""
@@ -187,31 +224,22 @@ class TestConfiguration:
         assert isinstance(main.WHISPER_MODEL, str)
         assert isinstance(main.NUM_WORKERS, int)
 
-    @patch.dict(os.environ, {'TELEGRAM_BOT_TOKEN': '', 'API_ID': '12345', 'API_HASH': 'test_hash'})
+    @patch.multiple(main, TELEGRAM_BOT_TOKEN='', API_ID=12345, API_HASH='test_hash')
     def test_empty_telegram_token(self):
         """Test handling of empty Telegram bot token."""
-        import importlib
-        importlib.reload(main)
-        
         with pytest.raises(ValueError, match="TELEGRAM_BOT_TOKEN environment variable not set"):
             asyncio.run(main.main())
 
-    @patch.dict(os.environ, {}, clear=True)
+    @patch.multiple(main, TELEGRAM_BOT_TOKEN=None, API_ID=0, API_HASH='')
     def test_missing_telegram_token(self):
         """Test handling of missing Telegram bot token."""
-        import importlib
-        importlib.reload(main)
-        
         with pytest.raises(ValueError, match="TELEGRAM_BOT_TOKEN environment variable not set"):
             asyncio.run(main.main())
 
-    def test_worker_count_validation(self):
+    @pytest.mark.parametrize("count", [1, 2, 4, 8, 16])
+    def test_worker_count_validation(self, count):
         """Test validation of worker count configurations."""
-        valid_counts = [1, 2, 4, 8, 16]
-        
-        for count in valid_counts:
-            bot_core = BotCore(num_workers=count)
-            assert bot_core.num_workers == count
+        assert BotCore(num_workers=count).num_workers == count
 
     def test_configuration_boundaries(self):
         """Test configuration boundary values."""
@@ -249,8 +277,7 @@ class TestConfiguration:
     })
     def test_environment_integration_with_bot_core(self):
         """Test integration between environment variables and BotCore."""
-        import importlib
-        importlib.reload(main)
+        settings = main.Settings.from_env()
         
         # BotCore should use its own defaults, not main's env vars
         bot_core = BotCore()
@@ -258,8 +285,8 @@ class TestConfiguration:
         assert bot_core.num_workers == 2  # BotCore default
         
         # But main should use env vars
-        assert main.WHISPER_MODEL == "medium"
-        assert main.NUM_WORKERS == 6
+        assert settings.whisper_model == "medium"
+        assert settings.num_workers == 6
 
     def test_logging_configuration(self):
         """Test that logging is properly configured."""
@@ -270,27 +297,25 @@ class TestConfiguration:
         assert bot_core.logger is not None
         assert bot_core.logger.name == 'bot_core'
 
-    def test_per_worker_model_configuration(self):
-        """Test that each worker can have its own model configuration."""
+    def test_workers_share_one_model(self):
+        """Test that all workers share a single loaded model instance."""
         with patch('bot_core.whisper') as mock_whisper:
             mock_model = MagicMock()
             mock_whisper.load_model.return_value = mock_model
             
             # Create a bot_core instance for this test
-            bot_core = BotCore()
+            bot_core = BotCore(backend="openai")
             
             # Test multiple workers with same model
             worker_names = ["Worker-1", "Worker-2", "Worker-3"]
             
             for worker_name in worker_names:
-                # Each worker should be able to get its own model instance
                 model = bot_core.get_worker_model(worker_name)
                 assert model == mock_model
         
-        # Each worker should have loaded the same model
-        assert len(bot_core.models) == len(worker_names)
-        for worker_name in worker_names:
-            assert worker_name in bot_core.models
+            # The model should only have been loaded once for all workers
+            mock_whisper.load_model.assert_called_once_with("base", device="cpu")
+        assert list(BotCore._MODEL_CACHE) == [(*bot_core._model_key, "cpu")]
 
     def test_memory_management_configuration(self):
         """Test configuration affects memory usage patterns."""
@@ -1,5 +1,6 @@
 import pytest
 import asyncio
+from unittest.mock import patch
 from bot_core import BotCore, AudioMessage
 
 pytestmark = pytest.mark.asyncio
@@ -8,16 +9,41 @@ pytestmark = pytest.mark.asyncio
 class TestQueueManagement:
     """Test queue management and validation functionality."""
 
-    def test_validate_audio_file_valid(self, bot_core, sample_audio):
+    def test_validate_audio_file_valid(self, bot_core_ro, sample_audio):
         """Test that valid audio files pass validation."""
-        result = bot_core.validate_audio_file(sample_audio)
+        result = bot_core_ro.validate_audio_file(sample_audio)
         assert result is None
 
-    def test_validate_audio_file_too_large(self, bot_core, large_audio):
+    def test_validate_audio_file_too_large(self, bot_core_ro, large_audio):
         """Test that oversized files are rejected."""
-        result = bot_core.validate_audio_file(large_audio)
+        result = bot_core_ro.validate_audio_file(large_audio)
         assert result == "File is too large. The limit is 2 GB."
 
+    async def test_validate_audio_file_duration(self, bot_core_ro):
+        """Test that duration metadata rejects too-short clips and is optional, with 0 meaning unknown."""
+        short = AudioMessage("id", 1024, "audio/ogg", "voice.ogg", duration=0.5)
+        long_enough = AudioMessage("id", 1024, "audio/ogg", "voice.ogg", duration=5)
+        unknown = AudioMessage("id", 1024, "audio/ogg", "voice.ogg")
+        unmeasured = AudioMessage("id", 1024, "audio/ogg", "voice.ogg", duration=0)
+        
+        assert "too short" in bot_core_ro.validate_audio_file(short)
+        assert bot_core_ro.validate_audio_file(long_enough) is None
+        assert bot_core_ro.validate_audio_file(unknown) is None
+        assert bot_core_ro.validate_audio_file(unmeasured) is None
+
+    async def test_queue_position_follows_file_size(self, bot_core):
+        """Test that a new file's position only counts the queued files handed out before it."""
+        for chat_id, size in ((1, 4096), (2, 1024), (3, 2048)):
+            audio = AudioMessage(f"file_{chat_id}", size, "audio/ogg", "voice.ogg")
+            await bot_core.queue_audio_job(chat_id=chat_id, message_id=1, audio=audio, processing_msg_id=2)
+        
+        assert bot_core.get_queue_position(512) == 0
+        assert bot_core.get_queue_position(2048) == 2
+        assert bot_core.get_queue_position(8192) == 3
+        
+        await bot_core.processing_queue.get()  # Takes the 1024-byte file
+        assert bot_core.get_queue_position(2048) == 1
+
     def test_queue_initially_empty(self, bot_core):
         """Test that queue starts empty."""
         assert bot_core.get_queue_position() == 0
@@ -82,6 +108,19 @@ class TestQueueManagement:
         assert bot_core.get_queue_position() == 2
         assert bot_core.is_queue_full()
 
+    async def test_queue_itself_is_bounded(self, sample_audio):
+        """Test that the queue enforces the capacity even when the admission check is bypassed."""
+        bot_core = BotCore(max_queue_size=1)
+        await bot_core.queue_audio_job(chat_id=1, message_id=1, audio=sample_audio, processing_msg_id=100)
+
+        with patch.object(bot_core, 'check_admission', return_value=None):
+            success, error = await bot_core.queue_audio_job(chat_id=2, message_id=2, audio=sample_audio, processing_msg_id=101)
+
+        assert success is False
+        assert "queue is full" in error
+        assert bot_core.get_queue_position() == 1
+        assert bot_core.get_user_queue_count(2) == 0
+
     async def test_filename_generation(self, bot_core, voice_message):
         """Test filename generation for voice messages."""
         success, _ = await bot_core.queue_audio_job(
@@ -92,3 +131,16 @@ class TestQueueManagement:
         job = await bot_core.processing_queue.get()
         assert job.file_name == "voice_message.ogg"
 
+
+    async def test_smaller_files_dequeued_first(self, bot_core):
+        """Test that the queue favors small files and keeps FIFO order among equal sizes."""
+        for chat_id, size in [(1, 50 * 1024 * 1024), (2, 100 * 1024), (3, 1024 * 1024), (4, 100 * 1024)]:
+            audio = AudioMessage(f"file_{chat_id}", size, "audio/ogg", "voice.ogg", file_unique_id=f"unique_{chat_id}")
+            await bot_core.queue_audio_job(chat_id, 1, audio, 2)
+        
+        assert bot_core._peek_last_queued().chat_id == 4
+        
+        order = [(await bot_core.processing_queue.get()).chat_id for _ in range(4)]
+        
+        assert order == [2, 4, 3, 1]
+        assert bot_core._peek_last_queued() is None
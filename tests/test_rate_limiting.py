@@ -215,6 +215,12 @@ class TestRateLimiting:
         rate_limited_bot_core.increment_user_queue_count(12345)
         assert rate_limited_bot_core.can_user_submit_job(12345) is False
 
+    async def test_count_lookups_do_not_create_entries(self, rate_limited_bot_core):
+        """Test that checking a user's count doesn't grow the tracking dict."""
+        assert rate_limited_bot_core.can_user_submit_job(12345) is True
+        assert rate_limited_bot_core.get_user_queue_count(12345) == 0
+        assert 12345 not in rate_limited_bot_core.user_queue_count
+
     def test_decrement_prevents_negative_counts(self, rate_limited_bot_core):
         """Test that decrementing doesn't go below zero."""
         chat_id = 12345
@@ -74,31 +74,59 @@ class TestTelegramHandlers:
         """Test handling of voice messages."""
         with patch.object(main.bot_core, 'validate_audio_file', return_value=None), \
              patch.object(main.bot_core, 'queue_audio_job', return_value=(True, None)) as mock_queue, \
-             patch.object(main.bot_core, 'get_queue_position', return_value=1):
+             patch.object(main.bot_core, 'get_queue_position', return_value=0) as mock_position:
             
             await main.handle_audio(mock_voice_event)
             
             # Should queue the job
             mock_queue.assert_called_once()
             
-            # Should send initial queueing message and then update with position
-            assert mock_voice_event.respond.call_count == 1
-            assert mock_voice_event.client.edit_message.call_count == 1
+            # Should reply once, with the queue position for this file's size already filled in
+            mock_position.assert_called_once_with(1024 * 1024)
+            mock_voice_event.respond.assert_called_once_with("Your file has been queued for processing. Position: 1")
+            mock_voice_event.client.edit_message.assert_not_called()
 
     async def test_handle_audio_message(self, mock_audio_event):
         """Test handling of audio file messages."""
         with patch.object(main.bot_core, 'validate_audio_file', return_value=None), \
              patch.object(main.bot_core, 'queue_audio_job', return_value=(True, None)) as mock_queue, \
-             patch.object(main.bot_core, 'get_queue_position', return_value=1):
+             patch.object(main.bot_core, 'get_queue_position', return_value=0):
             
             await main.handle_audio(mock_audio_event)
             
             # Should queue the job
             mock_queue.assert_called_once()
             
-            # Should send initial queueing message and then update with position
-            assert mock_audio_event.respond.call_count == 1
-            assert mock_audio_event.client.edit_message.call_count == 1
+            # Should reply once, with the queue position already filled in
+            mock_audio_event.respond.assert_called_once_with("Your file has been queued for processing. Position: 1")
+            mock_audio_event.client.edit_message.assert_not_called()
+
+    async def test_handle_too_short_voice_rejected_before_queueing(self, mock_voice_event):
+        """Test that a voice note reported as too short is rejected from metadata alone."""
+        mock_voice_event.message.media.document.attributes = [
+            DocumentAttributeAudio(duration=0.5, voice=True)
+        ]
+        
+        with patch.object(main.bot_core, 'queue_audio_job') as mock_queue:
+            await main.handle_audio(mock_voice_event)
+            
+            mock_queue.assert_not_called()
+            mock_voice_event.respond.assert_called_once_with(
+                "The audio file is too short to transcribe (less than 1 seconds)."
+            )
+
+    async def test_handle_zero_duration_treated_as_unknown(self, mock_voice_event):
+        """Test that a duration of 0 is left to the post-decode check instead of rejecting the file."""
+        mock_voice_event.message.media.document.attributes = [
+            DocumentAttributeAudio(duration=0, voice=True)
+        ]
+        
+        with patch.object(main.bot_core, 'queue_audio_job', return_value=(True, None)) as mock_queue, \
+             patch.object(main.bot_core, 'get_queue_position', return_value=0):
+            await main.handle_audio(mock_voice_event)
+            
+            mock_queue.assert_called_once()
+            assert mock_queue.call_args[1]['audio'].duration is None
 
     async def test_handle_oversized_file_rejection(self, mock_audio_event):
         """Test rejection of oversized files."""
@@ -117,7 +145,22 @@ class TestTelegramHandlers:
             )
 
     async def test_handle_queue_full_rejection(self, mock_voice_event):
-        """Test rejection when queue is full."""
+        """Test rejection when the queue is already full."""
+        queue_full_error = f"Sorry, the processing queue is full ({main.MAX_QUEUE_SIZE} files). Please try again later."
+        
+        with patch.object(main.bot_core, 'validate_audio_file', return_value=None), \
+             patch.object(main.bot_core, 'check_admission', return_value=queue_full_error), \
+             patch.object(main.bot_core, 'queue_audio_job') as mock_queue:
+            
+            await main.handle_audio(mock_voice_event)
+            
+            # Should reply with the error alone, without queueing or editing
+            mock_queue.assert_not_called()
+            mock_voice_event.respond.assert_called_once_with(queue_full_error)
+            mock_voice_event.client.edit_message.assert_not_called()
+
+    async def test_handle_queue_filled_while_replying(self, mock_voice_event):
+        """Test rejection when the queue fills up after the admission check."""
         queue_full_error = f"Sorry, the processing queue is full ({main.MAX_QUEUE_SIZE} files). Please try again later."
         
         with patch.object(main.bot_core, 'validate_audio_file', return_value=None), \
@@ -131,9 +174,11 @@ class TestTelegramHandlers:
             # Should attempt to queue the job
             mock_queue.assert_called_once()
             
-            # Should send queueing message then edit with error
+            # Should send the queued reply, then edit it to the error
             mock_voice_event.respond.assert_called_once()
-            mock_voice_event.client.edit_message.assert_called_once()
+            mock_voice_event.client.edit_message.assert_called_once_with(
+                entity=mock_voice_event.chat_id, message=999, text=queue_full_error
+            )
 
     async def test_handle_voice_filename_generation(self, mock_voice_event):
         """Test filename generation for voice messages."""
@@ -182,42 +227,67 @@ class TestTelegramHandlers:
             mock_queue.assert_not_called()
             mock_event.respond.assert_not_called()
 
+    async def test_audio_filter(self, mock_voice_event, mock_event):
+        """Test that the dispatch filter passes audio documents only."""
+        assert main.is_audio_message(mock_voice_event) is True
+        
+        mock_voice_event.message.media.document.mime_type = "image/png"
+        assert main.is_audio_message(mock_voice_event) is False
+        
+        mock_event.message.media = None
+        assert main.is_audio_message(mock_event) is False
+        
+        mock_event.message.media = object()  # e.g. a photo, which has no document
+        assert main.is_audio_message(mock_event) is False
+
     async def test_worker_model_loading(self):
         """Test that workers load their own Whisper models."""
         from telethon import TelegramClient
         
-        with patch('main.whisper') as mock_whisper:
-            mock_model = MagicMock()
-            mock_whisper.load_model.return_value = mock_model
-            mock_client = AsyncMock(spec=TelegramClient)
-            
-            # Mock bot_core.get_worker_model to return our mock model
-            with patch.object(main.bot_core, 'get_worker_model', return_value=mock_model) as mock_get_model, \
-                 patch.object(main.bot_core.processing_queue, 'get', new_callable=AsyncMock) as mock_get:
-                # Make get() raise an exception to exit the worker loop immediately
-                mock_get.side_effect = asyncio.CancelledError("Exit worker loop")
-                
-                with pytest.raises(asyncio.CancelledError):
-                    await main.worker("TestWorker", mock_client)
-                
-                # Verify model was requested for this worker
-                mock_get_model.assert_called_once_with("TestWorker")
+        mock_model = MagicMock()
+        mock_client = AsyncMock(spec=TelegramClient)
+        
+        # Mock bot_core.get_worker_model to return our mock model
+        with patch.object(main.bot_core, 'get_worker_model', return_value=mock_model) as mock_get_model, \
+             patch.object(main.bot_core.processing_queue, 'get', new_callable=AsyncMock) as mock_get:
+            # Make get() raise an exception to exit the worker loop immediately
+            mock_get.side_effect = asyncio.CancelledError("Exit worker loop")
+            
+            with pytest.raises(asyncio.CancelledError):
+                await main.worker("TestWorker", mock_client)
+            
+            # Verify model was requested for this worker
+            mock_get_model.assert_called_once_with("TestWorker")
 
     async def test_worker_model_loading_failure(self):
         """Test worker behavior when model loading fails."""
         from telethon import TelegramClient
         
-        with patch('main.whisper') as mock_whisper:
-            mock_whisper.load_model.side_effect = Exception("Model loading failed")
-            mock_client = AsyncMock(spec=TelegramClient)
-            
-            # Mock bot_core.get_worker_model to return None (failure)
-            with patch.object(main.bot_core, 'get_worker_model', return_value=None) as mock_get_model:
-                # Worker should exit when model loading fails
-                result = await main.worker("FailWorker", mock_client)
-                
-                # Should attempt to get model for this worker
-                mock_get_model.assert_called_once_with("FailWorker")
+        mock_client = AsyncMock(spec=TelegramClient)
+        
+        # Mock bot_core.get_worker_model to return None (failure)
+        with patch.object(main.bot_core, 'get_worker_model', return_value=None) as mock_get_model:
+            # Worker should exit when model loading fails
+            result = await main.worker("FailWorker", mock_client)
+            
+            # Should attempt to get model for this worker
+            mock_get_model.assert_called_once_with("FailWorker")
+
+    async def test_worker_loads_model_off_event_loop(self):
+        """Test that the blocking model load runs in a thread, not on the event loop."""
+        from telethon import TelegramClient
+        import threading
+        
+        loader_threads = []
+        
+        def load(name):
+            loader_threads.append(threading.current_thread())
+            return None
+        
+        with patch.object(main.bot_core, 'get_worker_model', side_effect=load):
+            await main.worker("ThreadWorker", AsyncMock(spec=TelegramClient))
+        
+        assert loader_threads and loader_threads[0] is not threading.main_thread()
 
     async def test_start_workers_creates_workers(self):
         """Test that start_workers creates the correct number of worker tasks."""
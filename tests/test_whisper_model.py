@@ -1,6 +1,7 @@
 import pytest
-from unittest.mock import patch, MagicMock
-from bot_core import BotCore
+import numpy as np
+from unittest.mock import patch, MagicMock, ANY
+from bot_core import BotCore, FasterWhisperBackend, OpenAIWhisperBackend, WhisperCppBackend, CudaGraphRunner
 
 # pytestmark = pytest.mark.asyncio  # Not needed for synchronous tests
 
@@ -14,23 +15,23 @@ class TestWhisperModel:
             mock_model = MagicMock()
             mock_whisper.load_model.return_value = mock_model
             
-            bot_core = BotCore(whisper_model="base")
+            bot_core = BotCore(whisper_model="base", backend="openai")
             result = bot_core.get_worker_model("test_worker")
             
             assert result == mock_model
-            assert bot_core.models["test_worker"] == mock_model
-            mock_whisper.load_model.assert_called_once_with("base")
+            assert BotCore._MODEL_CACHE[(*bot_core._model_key, "cpu")] == mock_model
+            mock_whisper.load_model.assert_called_once_with("base", device="cpu")
 
     def test_get_worker_model_failure(self):
         """Test Whisper model loading failure."""
         with patch('bot_core.whisper') as mock_whisper:
             mock_whisper.load_model.side_effect = Exception("Model loading failed")
             
-            bot_core = BotCore(whisper_model="base")
+            bot_core = BotCore(whisper_model="base", backend="openai")
             result = bot_core.get_worker_model("test_worker")
             
             assert result is None
-            assert "test_worker" not in bot_core.models
+            assert (*bot_core._model_key, "cpu") not in BotCore._MODEL_CACHE
 
     def test_load_different_model_sizes(self):
         """Test loading different Whisper model sizes."""
@@ -39,8 +40,332 @@ class TestWhisperModel:
             mock_whisper.load_model.return_value = mock_model
             
             for model_size in ["tiny", "base", "small", "medium", "large"]:
-                bot_core = BotCore(whisper_model=model_size)
+                bot_core = BotCore(whisper_model=model_size, backend="openai")
                 result = bot_core.get_worker_model("test_worker")
                 
                 assert result == mock_model
-                mock_whisper.load_model.assert_called_with(model_size)
\ No newline at end of file
+                mock_whisper.load_model.assert_called_with(model_size, device="cpu")
+
+    def test_model_shared_across_instances(self):
+        """Test that the model is loaded once per process, not per worker or instance."""
+        with patch('bot_core.whisper') as mock_whisper:
+            mock_model = MagicMock()
+            mock_whisper.load_model.return_value = mock_model
+            
+            first = BotCore(whisper_model="base", backend="openai").get_worker_model("Worker-1")
+            second = BotCore(whisper_model="base", backend="openai").get_worker_model("Worker-2")
+            
+            assert first is second is mock_model
+            mock_whisper.load_model.assert_called_once_with("base", device="cpu")
+
+    def test_model_warmed_up_once_after_loading(self):
+        """Test that a freshly loaded model runs one warm-up batch before workers get it."""
+        with patch('bot_core.whisper') as mock_whisper, \
+             patch.object(OpenAIWhisperBackend, 'warm_up') as mock_warm_up:
+            mock_model = MagicMock()
+            mock_whisper.load_model.return_value = mock_model
+            
+            bot_core = BotCore(whisper_model="base", backend="openai", max_batch_size=4)
+            bot_core.get_worker_model("Worker-1")
+            bot_core.get_worker_model("Worker-2")
+            
+            # openai transcribes clip by clip, so it never gets batches to warm up for
+            mock_warm_up.assert_called_once_with(mock_model, 1)
+
+    def test_model_warm_up_failure_keeps_model(self):
+        """Test that a failed warm-up is logged and the model is still used."""
+        with patch('bot_core.whisper') as mock_whisper, \
+             patch.object(OpenAIWhisperBackend, 'warm_up', side_effect=RuntimeError("CUDA out of memory")):
+            mock_model = MagicMock()
+            mock_whisper.load_model.return_value = mock_model
+            
+            result = BotCore(whisper_model="base", backend="openai").get_worker_model("Worker-1")
+            
+            assert result is mock_model
+
+    def test_openai_backend_quantizes_cpu_model(self):
+        """Test that the openai backend applies dynamic int8 quantization to Linear layers on CPU."""
+        class Linear:
+            pass
+        
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch') as mock_torch:
+            mock_torch.nn.Linear = Linear
+            mock_model = MagicMock()
+            mock_model.device.type = "cpu"
+            mock_model.modules.return_value = []
+            mock_whisper.load_model.return_value = mock_model
+            
+            model = OpenAIWhisperBackend(compute_type="int8").load_model("small")
+            
+            assert model == mock_torch.quantization.quantize_dynamic.return_value
+            mock_torch.quantization.quantize_dynamic.assert_called_once_with(
+                mock_model, {Linear}, dtype=mock_torch.qint8
+            )
+
+    def test_openai_backend_skips_quantization(self):
+        """Test that float compute types and GPU models are left unquantized."""
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch') as mock_torch:
+            mock_model = MagicMock()
+            mock_whisper.load_model.return_value = mock_model
+            
+            mock_model.device.type = "cpu"
+            assert OpenAIWhisperBackend(compute_type="float32").load_model("small") == mock_model
+            
+            mock_model.device.type = "cuda"
+            assert OpenAIWhisperBackend(compute_type="int8").load_model("small") == mock_model
+            
+            mock_torch.quantization.quantize_dynamic.assert_not_called()
+
+    def test_openai_backend_splits_cpu_threads_between_workers(self):
+        """Test that CPU models limit PyTorch's intra-op threads to each worker's share of the cores."""
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch') as mock_torch, \
+             patch('bot_core.os.cpu_count', return_value=8):
+            mock_whisper.load_model.return_value.device.type = "cpu"
+            
+            OpenAIWhisperBackend(compute_type="float32", num_workers=4).load_model("small")
+            
+            mock_torch.set_num_threads.assert_called_once_with(2)
+
+    def test_workers_spread_across_gpus(self):
+        """Test that workers are assigned round-robin to GPUs with one model per GPU."""
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch') as mock_torch:
+            mock_torch.cuda.is_available.return_value = True
+            mock_torch.cuda.device_count.return_value = 2
+            mock_whisper.load_model.side_effect = lambda name, device: MagicMock(name=device)
+            
+            bot_core = BotCore(whisper_model="base", backend="openai")
+            models = [bot_core.get_worker_model(f"Worker-{i}") for i in range(3)]
+            
+            assert [call.kwargs["device"] for call in mock_whisper.load_model.call_args_list] == ["cuda:0", "cuda:1"]
+            assert models[0] is models[2]
+            assert models[0] is not models[1]
+
+    def test_openai_backend_uses_fp16_on_gpu(self):
+        """Test that fp16 inference is requested only for GPU models."""
+        model = MagicMock()
+        model.transcribe.return_value = {"text": "Hello"}
+        backend = OpenAIWhisperBackend()
+        
+        model.device.type = "cuda"
+        with patch('bot_core.torch') as mock_torch:
+            backend.transcribe(model, [0])
+        moved = mock_torch.from_numpy.return_value.to.return_value
+        mock_torch.from_numpy.return_value.to.assert_called_once_with(model.device)
+        model.transcribe.assert_called_with(moved, fp16=True, word_timestamps=False, condition_on_previous_text=False)
+        
+        model.device.type = "cpu"
+        backend.transcribe(model, [0])
+        model.transcribe.assert_called_with([0], fp16=False, word_timestamps=False, condition_on_previous_text=False)
+
+    def test_openai_backend_moves_audio_to_gpu(self):
+        """Test that GPU models get the samples on their device, so the mel STFT runs there."""
+        model = MagicMock()
+        model.device.type = "cuda"
+        model.transcribe.return_value = {"text": "Hello"}
+        
+        with patch('bot_core.torch') as mock_torch:
+            OpenAIWhisperBackend().transcribe(model, np.zeros(16000, dtype=np.float32))
+        
+        mock_torch.from_numpy.return_value.to.assert_called_once_with(model.device)
+        assert model.transcribe.call_args[0][0] is mock_torch.from_numpy.return_value.to.return_value
+
+    def test_openai_backend_graphs_gpu_encoder(self):
+        """Test that GPU models run the encoder through a CUDA graph and CPU models don't."""
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch'):
+            model = mock_whisper.load_model.return_value
+            forward = model.encoder.forward
+            
+            model.device.type = "cuda"
+            OpenAIWhisperBackend(compute_type="float16").load_model("small", device="cuda:0")
+            assert isinstance(model.encoder.forward, CudaGraphRunner)
+            assert model.encoder.forward.forward is forward
+            
+            model.encoder.forward = forward
+            model.device.type = "cpu"
+            OpenAIWhisperBackend(compute_type="float32").load_model("small")
+            assert model.encoder.forward is forward
+
+    def test_openai_backend_compiles_gpu_encoder_when_enabled(self):
+        """Test that the encoder is compiled before graph capture only when asked to."""
+        with patch('bot_core.whisper') as mock_whisper, patch('bot_core.torch') as mock_torch:
+            model = mock_whisper.load_model.return_value
+            model.device.type = "cuda"
+            forward = model.encoder.forward
+            
+            OpenAIWhisperBackend(compute_type="float16", compile_encoder=True).load_model("small", device="cuda:0")
+            
+            mock_torch.compile.assert_called_once_with(forward, dynamic=False)
+            assert model.encoder.forward.forward is mock_torch.compile.return_value
+            
+            mock_torch.compile.reset_mock()
+            model.encoder.forward = forward
+            OpenAIWhisperBackend(compute_type="float16").load_model("small", device="cuda:0")
+            mock_torch.compile.assert_not_called()
+
+    def test_cuda_graph_captured_once_per_shape(self):
+        """Test that a graph is captured on first use and replayed afterwards."""
+        forward = MagicMock()
+        runner = CudaGraphRunner(forward)
+        mel = MagicMock(is_cuda=True, shape=(1, 80, 3000))
+        
+        with patch('bot_core.torch') as mock_torch:
+            mock_torch.is_grad_enabled.return_value = False
+            runner(mel)
+            runner(mel)
+            
+            graph = mock_torch.cuda.CUDAGraph.return_value
+            mock_torch.cuda.CUDAGraph.assert_called_once()
+            assert graph.replay.call_count == 2
+            assert forward.call_count == CudaGraphRunner.WARMUP_RUNS + 1
+            
+            mock_torch.is_grad_enabled.return_value = True
+            runner(mel)
+            forward.assert_called_with(mel)
+
+    def test_faster_whisper_backend_loads_quantized_model(self):
+        """Test that the faster-whisper backend loads an int8 CTranslate2 model."""
+        with patch('bot_core.faster_whisper') as mock_faster_whisper:
+            mock_model = MagicMock()
+            mock_faster_whisper.WhisperModel.return_value = mock_model
+            
+            bot_core = BotCore(whisper_model="small", backend="faster-whisper", compute_type="int8")
+            result = bot_core.get_worker_model("test_worker")
+            
+            assert result == mock_model
+            mock_faster_whisper.WhisperModel.assert_called_once_with(
+                "small", device="auto", compute_type="int8", num_workers=2, cpu_threads=ANY
+            )
+
+    def test_faster_whisper_model_runs_workers_in_parallel(self):
+        """Test that the shared model gets one CTranslate2 worker per transcription thread."""
+        with patch('bot_core.faster_whisper') as mock_faster_whisper, \
+             patch('bot_core.os.cpu_count', return_value=8):
+            BotCore(whisper_model="tiny", backend="faster-whisper", num_workers=4).get_worker_model("test_worker")
+            
+            kwargs = mock_faster_whisper.WhisperModel.call_args.kwargs
+            assert kwargs["num_workers"] == 4
+            assert kwargs["cpu_threads"] == 2
+
+    def test_faster_whisper_backend_joins_segments(self):
+        """Test that faster-whisper segments are joined into one transcription."""
+        model = MagicMock()
+        model.transcribe.return_value = (
+            iter([MagicMock(text=" Hello"), MagicMock(text=" world")]),
+            MagicMock(),
+        )
+        
+        model.feature_extractor.n_samples = 16000 * 30
+        
+        text = FasterWhisperBackend().transcribe(model, "/tmp/test/audio.ogg")
+        
+        assert text == " Hello world"
+        model.transcribe.assert_called_once_with(
+            "/tmp/test/audio.ogg", beam_size=1, vad_filter=True, vad_parameters={"min_silence_duration_ms": 500}
+        )
+
+    def test_faster_whisper_long_audio_uses_batched_pipeline(self):
+        """Test that recordings longer than one window are chunked by VAD and decoded in batches."""
+        model = MagicMock()
+        model.feature_extractor.n_samples = 16000 * 30
+        audio = np.zeros(16000 * 600, dtype=np.float32)
+        
+        with patch('bot_core.faster_whisper') as mock_faster_whisper:
+            pipeline = mock_faster_whisper.BatchedInferencePipeline.return_value
+            pipeline.transcribe.return_value = (iter([MagicMock(text=" Long"), MagicMock(text=" talk")]), MagicMock())
+            
+            text = FasterWhisperBackend().transcribe(model, audio)
+        
+        assert text == " Long talk"
+        mock_faster_whisper.BatchedInferencePipeline.assert_called_once_with(model)
+        assert pipeline.transcribe.call_args.kwargs["batch_size"] == 16
+        model.transcribe.assert_not_called()
+
+    def test_faster_whisper_batch_splits_long_clips(self):
+        """Test that clips within one 30 s window are batched and longer ones decoded alone."""
+        model = MagicMock()
+        model.feature_extractor.n_samples = 16000 * 30
+        audios = [[0] * 16000, [0] * (16000 * 60), [0] * 16000 * 5]
+        backend = FasterWhisperBackend()
+        
+        with patch.object(backend, '_speech_only', side_effect=lambda audio: audio), \
+             patch.object(backend, '_generate_batch', return_value=["short one", "short two"]) as mock_generate, \
+             patch.object(backend, 'transcribe', return_value="long") as mock_transcribe:
+            texts = backend.transcribe_batch(model, audios)
+        
+        assert texts == ["short one", "long", "short two"]
+        mock_generate.assert_called_once_with(model, [audios[0], audios[2]])
+        mock_transcribe.assert_called_once_with(model, audios[1])
+
+    def test_faster_whisper_warm_up_fills_a_batch(self):
+        """Test that warm-up decodes a full batch of silent windows, bypassing VAD."""
+        backend = FasterWhisperBackend()
+        model = MagicMock()
+        model.feature_extractor.n_samples = 480000
+        
+        with patch.object(backend, '_generate_batch') as mock_generate:
+            backend.warm_up(model, 4)
+        
+        clips = mock_generate.call_args.args[1]
+        assert len(clips) == 4
+        assert all(len(clip) == 480000 and not clip.any() for clip in clips)
+
+    def test_openai_backend_drops_non_speech_frames(self):
+        """Test that only 30 ms frames webrtcvad marks as speech reach the model."""
+        model = MagicMock()
+        model.device.type = "cpu"
+        model.transcribe.return_value = {"text": "Hello"}
+        audio = np.concatenate([np.full(480, 0.5, dtype=np.float32), np.zeros(480, dtype=np.float32)])
+        
+        with patch('bot_core.webrtcvad') as mock_webrtcvad:
+            mock_webrtcvad.Vad.return_value.is_speech.side_effect = lambda frame, rate: any(frame)
+            assert OpenAIWhisperBackend().transcribe(model, audio) == "Hello"
+            
+            mock_webrtcvad.Vad.assert_called_with(2)
+            assert len(model.transcribe.call_args[0][0]) == 480
+            
+            model.transcribe.reset_mock()
+            assert OpenAIWhisperBackend().transcribe(model, np.zeros(960, dtype=np.float32)) == ""
+            model.transcribe.assert_not_called()
+
+    def test_openai_backend_batch_transcribes_each_clip(self):
+        """Test that the openai backend handles a batch one clip at a time."""
+        model = MagicMock()
+        model.transcribe.side_effect = [{"text": "first"}, {"text": "second"}]
+        
+        assert OpenAIWhisperBackend().transcribe_batch(model, [[0], [1]]) == ["first", "second"]
+
+    def test_faster_whisper_not_installed(self):
+        """Test that a missing faster-whisper package is reported, not raised."""
+        with patch('bot_core.faster_whisper', None):
+            bot_core = BotCore(backend="faster-whisper")
+            assert bot_core.get_worker_model("test_worker") is None
+
+    def test_whispercpp_backend_loads_model(self):
+        """Test that the whispercpp backend loads a GGML model per worker, without cross-window prompts."""
+        with patch('bot_core.whispercpp') as mock_whispercpp, patch('bot_core.os.cpu_count', return_value=8):
+            bot_core = BotCore(whisper_model="base-q8_0", backend="whispercpp", num_workers=2)
+            bot_core.get_worker_model("Worker-1")
+            bot_core.get_worker_model("Worker-2")
+            
+            # One context per worker, each using its worker's share of the cores
+            assert mock_whispercpp.Model.call_count == 2
+            mock_whispercpp.Model.assert_called_with(
+                "base-q8_0", n_threads=4, no_context=True, print_progress=False, print_realtime=False
+            )
+
+    def test_whispercpp_backend_joins_segments(self):
+        """Test that whisper.cpp segments are joined into the transcription."""
+        model = MagicMock()
+        model.transcribe.return_value = [MagicMock(text=" Hello"), MagicMock(text=" world")]
+        backend = WhisperCppBackend()
+        
+        with patch.object(backend, '_speech_only', side_effect=lambda audio: audio):
+            assert backend.transcribe(model, np.ones(16000, dtype=np.float32)) == " Hello world"
+            assert backend.transcribe(model, np.ones(0, dtype=np.float32)) == ""
+        
+        model.transcribe.assert_called_once()
+
+    def test_unknown_backend_rejected(self):
+        """Test that an unknown backend name fails fast."""
+        with pytest.raises(ValueError, match="Unknown Whisper backend"):
+            BotCore(backend="nonexistent")